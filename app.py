@@ -1,7 +1,14 @@
 import streamlit as st
 from multi_image_processor import MultiImageProcessor
 from web_processor import WebProcessor
-from utils import reset_session_state
+from services import Services
+from utils import render_metrics_panel, reset_session_state
+
+@st.cache_resource
+def get_services(api_key):
+    # Built once per API key and shared by every session and rerun
+    return Services(api_key)
+
 
 # Set page configuration
 st.set_page_config(page_title="AI-Driven Tool", layout="wide")
@@ -16,6 +23,10 @@ api_key = st.sidebar.text_input("Enter your API key:", type="password")
 if api_key:
     st.session_state["api_key"] = api_key
 
+# Optional debug panel with stage timings and cache hit rates
+if st.sidebar.checkbox("Show performance metrics"):
+    render_metrics_panel()
+
 # Check if the API key is set, if not prompt the user
 if "api_key" not in st.session_state:
     st.warning("Please enter your API key to proceed.")
@@ -34,9 +45,10 @@ else:
             st.session_state.last_option = option
 
         # Run the selected processor with the API key from session state
+        services = get_services(st.session_state["api_key"])
         if option == "Multi-Image":
-            MultiImageProcessor(api_key=st.session_state["api_key"]).run()
+            MultiImageProcessor(api_key=st.session_state["api_key"], image_generator=services.image_generator).run()
         elif option == "Web Search":
-            WebProcessor(api_key=st.session_state["api_key"]).run()
+            WebProcessor(api_key=st.session_state["api_key"], web_generator=services.web_generator).run()
 
         # Remove the redundant response box code
@@ -0,0 +1,458 @@
+# benchmark.py
+"""
+Offline performance benchmark of the image and web pipelines.
+
+Everything runs locally: the chat model and embeddings are deterministic fakes that simulate
+latency and token throughput, screenshots are synthesized into a ZIP, and web pages are served
+from a local HTTP server, so no network access is needed. Each scenario runs in a fresh process
+so peak memory is per scenario: ``peak_rss_mb`` covers the scenario process and
+``worker_peak_rss_mb`` the largest CPU pool worker (``--cpu-workers``). Without tiktoken's cached
+encodings, context token counts are estimated (see context_assembler).
+Usage:
+
+    python benchmark.py [--scenario all] [--images 40] [--pages 50] [--json results.json]
+    python benchmark.py --baseline results.json --tolerance 0.25   # exits 1 on regressions
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from zipfile import ZIP_STORED, ZipFile
+
+from PIL import Image, ImageDraw
+
+from cpu_pool import default_workers
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak memory is then not reported
+    resource = None
+
+DEFAULT_RESOLUTIONS = "1280x800,1920x1080,2560x1600,3840x2160"
+WORDS = (
+    "login password email submit cancel checkout cart account profile settings search filter order "
+    "payment invoice shipping address validation error required field button dialog confirm upload "
+    "download report dashboard notification session timeout redirect token permission admin user"
+).split()
+# Metrics where a larger value is an improvement; everything else (times, sizes, memory) should shrink
+HIGHER_IS_BETTER_SUFFIX = "_per_s"
+
+
+def fake_text(seed, words):
+    """Deterministic pseudo-sentences derived from ``seed``."""
+    rng = random.Random(hashlib.sha256(seed.encode("utf-8")).hexdigest())
+    sentences = []
+    for start in range(0, words, 12):
+        sentence = [rng.choice(WORDS) for _ in range(min(12, words - start))]
+        sentences.append(" ".join(sentence).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def create_fake_chat_model(latency=0.2, tokens_per_second=200.0, response_tokens=150):
+    """
+    Builds a chat model stand-in that answers deterministically after a simulated delay.
+
+    Args:
+        latency (float): Seconds before the first token (network round trip plus prefill).
+        tokens_per_second (float): Simulated generation speed.
+        response_tokens (int): Words per response, each counted as one token.
+
+    Prompt tokens are counted as words too, so the fake never needs tiktoken's downloaded encodings.
+    """
+    from langchain.chat_models.base import BaseChatModel
+    from langchain.schema import ChatGeneration, ChatResult
+    from langchain.schema.messages import AIMessage, AIMessageChunk
+    from langchain.schema.output import ChatGenerationChunk
+
+    class FakeChatModel(BaseChatModel):
+        model_name: str = "fake-chat"
+        temperature: float = 0.0
+        latency: float = 0.2
+        tokens_per_second: float = 200.0
+        response_tokens: int = 150
+
+        @property
+        def _llm_type(self):
+            return "fake-chat"
+
+        @staticmethod
+        def prompt_text(messages):
+            parts = []
+            for message in messages:
+                if isinstance(message.content, str):
+                    parts.append(message.content)
+                else:
+                    parts.extend(part.get("text", "") for part in message.content if isinstance(part, dict))
+            return "\n".join(parts)
+
+        def response_words(self, messages):
+            return fake_text(self.prompt_text(messages), self.response_tokens).split()
+
+        def usage(self, messages):
+            # Image parts are not counted; the text of the prompt counts one token per word
+            prompt_tokens = len(self.prompt_text(messages).split())
+            return {"prompt_tokens": prompt_tokens, "completion_tokens": self.response_tokens,
+                    "total_tokens": prompt_tokens + self.response_tokens}
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            words = self.response_words(messages)
+            time.sleep(self.latency + len(words) / self.tokens_per_second)
+            usage = self.usage(messages)
+            message = AIMessage(content=" ".join(words), response_metadata={"token_usage": usage})
+            return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"token_usage": usage})
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(self.latency)
+            for position, word in enumerate(self.response_words(messages)):
+                time.sleep(1 / self.tokens_per_second)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word if position == 0 else f" {word}"))
+
+    return FakeChatModel(latency=latency, tokens_per_second=tokens_per_second, response_tokens=response_tokens)
+
+
+def create_fake_embeddings(latency=0.05, per_text_latency=0.0005, dimensions=256):
+    """Deterministic hashing embeddings that sleep like a remote embeddings endpoint would."""
+    from retrieval_eval import HashingEmbeddings
+
+    class FakeEmbeddings(HashingEmbeddings):
+        model = "fake-embeddings"
+
+        def embed_documents(self, texts):
+            time.sleep(latency + per_text_latency * len(texts))
+            return super().embed_documents(texts)
+
+        def embed_query(self, text):
+            time.sleep(latency)
+            return super().embed_query(text)
+
+    return FakeEmbeddings(dimensions)
+
+
+def parse_resolutions(text):
+    return [tuple(int(value) for value in item.lower().split("x")) for item in text.split(",") if item]
+
+
+def make_screenshot(index, size):
+    """Draws a synthetic UI screen: header, sidebar, form fields, buttons and text."""
+    rng = random.Random(index)
+    width, height = size
+    image = Image.new("RGB", size, (245, 246, 248))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width, height // 12), fill=(rng.randrange(20, 80), rng.randrange(60, 140), 200))
+    draw.rectangle((0, height // 12, width // 6, height), fill=(230, 232, 236))
+    y = height // 8
+    while y < height - 60:
+        x = width // 5 + rng.randrange(0, 40)
+        field_width = rng.randrange(width // 6, width // 2)
+        draw.rectangle((x, y, x + field_width, y + 36), outline=(180, 180, 190), fill="white")
+        draw.text((x + 8, y + 10), fake_text(f"{index}:{y}", 4), fill=(40, 40, 40))
+        if rng.random() < 0.3:
+            draw.rectangle((x + field_width + 20, y, x + field_width + 140, y + 36), fill=(30, 120, 220))
+            draw.text((x + field_width + 32, y + 10), rng.choice(WORDS).upper(), fill="white")
+        y += rng.randrange(50, 90)
+    # A little noise so screenshots compress like real ones rather than flat colour
+    for _ in range(width * height // 400):
+        draw.point((rng.randrange(width), rng.randrange(height)), fill=(rng.randrange(256),) * 3)
+    return image
+
+
+def make_image_zip(path, count, resolutions):
+    """Writes ``count`` PNG screenshots, cycling through ``resolutions``, to a ZIP at ``path``."""
+    with ZipFile(path, "w", ZIP_STORED) as archive:
+        for index in range(count):
+            buffer = io.BytesIO()
+            make_screenshot(index, resolutions[index % len(resolutions)]).save(buffer, format="PNG")
+            archive.writestr(f"screens/screen_{index:04d}.png", buffer.getvalue())
+    return os.path.getsize(path)
+
+
+def make_site(pages, words_per_page=800):
+    """Returns ``path -> HTML`` for a synthetic site whose pages carry nav/cookie/footer boilerplate."""
+    site = {}
+    for index in range(pages):
+        paragraphs = "".join(f"<p>{fake_text(f'page{index}:{p}', 80)}</p>" for p in range(words_per_page // 80))
+        site[f"/page/{index}.html"] = (
+            f"<html><head><title>Page {index}</title></head><body>"
+            f"<nav><a href='/'>Home</a> <a href='/page/{(index + 1) % pages}.html'>Next</a></nav>"
+            f"<div class='cookie-banner'>We use cookies.</div>"
+            f"<main><h1>Feature {index}: ERR-{1000 + index}</h1>{paragraphs}</main>"
+            f"<footer>Copyright benchmark site</footer></body></html>"
+        )
+    return site
+
+
+def serve_site(site):
+    """Serves ``site`` (and ``/sitemap.xml``) on a free local port; returns ``(server, base_url)``."""
+
+    class SiteHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like real servers
+
+        def do_GET(self):
+            base = f"http://{self.headers['Host']}"
+            if self.path == "/sitemap.xml":
+                urls = "".join(f"<url><loc>{base}{path}</loc></url>" for path in sorted(site))
+                body = f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+                content_type = "application/xml"
+            elif self.path in site:
+                body, content_type = site[self.path], "text/html; charset=utf-8"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def peak_memory_mb(who=None):
+    """
+    High-water mark of resident memory, in MB.
+
+    ``who`` defaults to this process; ``resource.RUSAGE_CHILDREN`` gives the largest single child
+    process that has exited and been waited for (e.g. a CPU pool worker after ``shutdown()``).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def create_benchmark_pool(workers):
+    """CPU pool whose workers are direct children of the scenario process, so their memory can be reported."""
+    from cpu_pool import create_cpu_pool
+
+    cpu_pool = create_cpu_pool(workers, start_method="spawn")
+    if cpu_pool is not None:
+        cpu_pool.submit(int).result()  # Start the workers outside the timed section
+    return cpu_pool
+
+
+def record_peak_memory(results, cpu_pool):
+    # Pool workers do the ingest and parsing, so they are reported alongside the scenario process
+    results["peak_rss_mb"] = peak_memory_mb()
+    results["worker_peak_rss_mb"] = peak_memory_mb(resource.RUSAGE_CHILDREN) if cpu_pool and resource else None
+
+
+def run_image_scenario(options):
+    from image_info_generator import ImageInfoGenerator
+    from metrics import get_metrics
+    from response_cache import ResponseCache
+    from zip_ingest import build_gallery
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        zip_path = os.path.join(work_dir, "screens.zip")
+        zip_bytes = make_image_zip(zip_path, options["images"], parse_resolutions(options["resolutions"]))
+        results["zip_mb"] = zip_bytes / 2 ** 20
+        gallery_dir = os.path.join(work_dir, "gallery")
+        os.makedirs(gallery_dir)
+
+        cpu_pool = create_benchmark_pool(options["cpu_workers"])
+        try:
+            started = time.perf_counter()
+            with open(zip_path, "rb") as upload:
+                gallery = build_gallery(upload, gallery_dir, executor=cpu_pool)
+            results["ingest_s"] = time.perf_counter() - started
+        finally:
+            if cpu_pool is not None:
+                cpu_pool.shutdown()
+        results["ingest_images_per_s"] = len(gallery) / results["ingest_s"]
+
+        started = time.perf_counter()
+        clusters = gallery.clusters()
+        results["cluster_s"] = time.perf_counter() - started
+
+        # A zero-size encode cache measures the full resize + JPEG + base64 cost of every image
+        encoder = ImageInfoGenerator(api_key="benchmark", encode_cache_size=0, response_cache=ResponseCache(),
+                                     chat_model=create_fake_chat_model())
+        encoded_bytes = 0
+        started = time.perf_counter()
+        for index in range(len(gallery)):
+            encoded_bytes += len(encoder.encode_image(gallery.decode_image(index)))
+        results["decode_encode_s"] = time.perf_counter() - started
+        results["encoded_kb_per_image"] = encoded_bytes / len(gallery) / 1024
+
+        generator = ImageInfoGenerator(
+            api_key="benchmark", response_cache=ResponseCache(),
+            chat_model=create_fake_chat_model(options["llm_latency"], options["tokens_per_second"],
+                                              options["response_tokens"])
+        )
+        get_metrics().reset()
+        started = time.perf_counter()
+        failures = [
+            description for _, description in generator.describe_images(
+                [partial(gallery.decode_image, cluster[0]) for cluster in clusters],
+                "Write test cases for this screen",
+                max_workers=options["workers"])
+            if description.startswith("Error")
+        ]
+        results["batch_qa_s"] = time.perf_counter() - started
+        if failures:
+            raise RuntimeError(f"{len(failures)} image request(s) failed, e.g. {failures[0]}")
+        results["batch_qa_images_per_s"] = len(clusters) / results["batch_qa_s"]
+        vision = get_metrics().snapshot()["stages"].get("vision_request", {})
+        results["qa_latency_avg_s"] = vision.get("avg_seconds", 0.0)
+        results["qa_latency_max_s"] = vision.get("max_seconds", 0.0)
+
+        started = time.perf_counter()
+        generator.describe_flow([gallery.decode_image(i) for i in range(min(len(gallery), 12))], "")
+        results["flow_qa_s"] = time.perf_counter() - started
+
+    record_peak_memory(results, cpu_pool)
+    return results
+
+
+def run_web_scenario(options):
+    from index_store import IndexStore
+    from response_cache import ResponseCache
+    from web_fetcher import WebFetcher
+    from web_test_case_generator import WebTestCaseGenerator
+
+    results = {}
+    server, base_url = serve_site(make_site(options["pages"], options["words_per_page"]))
+    cpu_pool = create_benchmark_pool(options["cpu_workers"])
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            generator = WebTestCaseGenerator(
+                api_key="benchmark",
+                index_store=IndexStore(cache_dir),
+                fetcher=WebFetcher(max_workers=options["workers"], per_host_interval=options["per_host_interval"]),
+                response_cache=ResponseCache(),
+                chat_model=create_fake_chat_model(options["llm_latency"], options["tokens_per_second"],
+                                                  options["response_tokens"]),
+                embeddings=create_fake_embeddings(options["embedding_latency"]),
+                cpu_pool=cpu_pool,
+            )
+
+            started = time.perf_counter()
+            vector_store, failed_urls = generator.load_or_crawl_vector_store([f"{base_url}/sitemap.xml"])
+            results["index_s"] = time.perf_counter() - started
+            if vector_store is None or failed_urls:
+                raise RuntimeError(f"Indexing the benchmark site failed ({len(failed_urls)} page(s))")
+            chunks = vector_store.index.ntotal
+            results["index_pages_per_s"] = options["pages"] / results["index_s"]
+            results["index_chunks_per_s"] = chunks / results["index_s"]
+
+            first_token, totals = [], []
+            for index in range(options["questions"]):
+                question = f"What are the validation rules for ERR-{1000 + index % options['pages']}?"
+                started = time.perf_counter()
+                documents = generator.retrieve(question, vector_store)
+                stream = generator.stream_response(question, documents)
+                next(stream)
+                first_token.append(time.perf_counter() - started)
+                for _ in stream:
+                    pass
+                totals.append(time.perf_counter() - started)
+            results["qa_first_token_p50_s"] = statistics.median(first_token)
+            results["qa_latency_p50_s"] = statistics.median(totals)
+            results["qa_latency_p95_s"] = percentile(totals, 0.95)
+    finally:
+        server.shutdown()
+        if cpu_pool is not None:
+            cpu_pool.shutdown()
+
+    record_peak_memory(results, cpu_pool)
+    return results
+
+
+SCENARIOS = {"images": run_image_scenario, "web": run_web_scenario}
+
+
+def run_isolated(name, options):
+    # A fresh interpreter per scenario, so peak memory and caches never leak between them
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(SCENARIOS[name], options).result()
+
+
+def compare(results, baseline, tolerance):
+    """Returns ``(scenario, metric, baseline, current)`` for every metric worse than baseline by > tolerance."""
+    regressions = []
+    for scenario, metrics in results.items():
+        for metric, value in metrics.items():
+            reference = baseline.get(scenario, {}).get(metric)
+            if value is None or not reference:
+                continue
+            if metric.endswith(HIGHER_IS_BETTER_SUFFIX):
+                worse = value < reference * (1 - tolerance)
+            else:
+                worse = value > reference * (1 + tolerance)
+            if worse:
+                regressions.append((scenario, metric, reference, value))
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenario", choices=["all", *SCENARIOS], default="all")
+    parser.add_argument("--images", type=int, default=40, help="Screenshots in the synthetic ZIP")
+    parser.add_argument("--resolutions", default=DEFAULT_RESOLUTIONS, help="Comma-separated WIDTHxHEIGHT list")
+    parser.add_argument("--pages", type=int, default=50, help="Pages on the synthetic site")
+    parser.add_argument("--words-per-page", type=int, default=800)
+    parser.add_argument("--questions", type=int, default=20, help="Web questions asked after indexing")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests / fetches")
+    parser.add_argument("--cpu-workers", type=int, default=default_workers(),
+                        help="Processes for thumbnailing and HTML parsing (0 runs them inline)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake model seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Fake model generation speed")
+    parser.add_argument("--response-tokens", type=int, default=150, help="Fake model tokens per answer")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Fake embeddings seconds per request")
+    parser.add_argument("--per-host-interval", type=float, default=0.0, help="Crawler politeness delay")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    options = vars(args)
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+
+    results = {}
+    for name in names:
+        results[name] = run_isolated(name, options)
+        print(f"\n{name}")
+        for metric, value in results[name].items():
+            print(f"  {metric:<28}{'n/a' if value is None else f'{value:.3f}':>12}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for scenario, metric, reference, value in regressions:
+            print(f"REGRESSION {scenario}.{metric}: {reference:.3f} -> {value:.3f}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
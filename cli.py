@@ -0,0 +1,308 @@
+# cli.py
+"""
+Headless batch entry point: generate responses for screenshot sets or web pages without Streamlit.
+
+Examples:
+    python cli.py -o out.jsonl images screenshots/ flows.zip --question "Write test cases for this screen"
+    python cli.py -o web.jsonl --markdown web.md web @urls.txt --question "List the form validations"
+
+Results are appended to a JSONL file as they complete; rerunning the same command skips
+inputs that already succeeded, so interrupted runs resume where they stopped. Use
+``--base-url`` to point the run at any OpenAI-compatible endpoint, e.g. a local fake in CI.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from zipfile import ZipFile, is_zipfile
+
+from PIL import Image
+
+from metrics import get_metrics
+from zip_ingest import IMAGE_EXTENSIONS, is_image_member
+
+
+class ProgressReporter:
+    """Prints a one-line progress summary to stderr as items complete."""
+
+    def __init__(self, total, stream=sys.stderr, enabled=True):
+        self.total = total
+        self.stream = stream
+        self.enabled = enabled
+        self.done = 0
+        self.errors = 0
+        self.cached = 0
+        self.started_at = time.monotonic()
+
+    def update(self, record):
+        self.done += 1
+        self.errors += record["status"] != "ok"
+        self.cached += bool(record.get("cached"))
+        if not self.enabled:
+            return
+        elapsed = time.monotonic() - self.started_at
+        rate = self.done / elapsed if elapsed else 0.0
+        eta = (self.total - self.done) / rate if rate else 0.0
+        self.stream.write(
+            f"[{self.done}/{self.total}] errors={self.errors} cached={self.cached} "
+            f"{rate:.2f} items/s eta {eta:.0f}s  {record['id']}\n"
+        )
+        self.stream.flush()
+
+
+def make_item_id(source, question):
+    """Resume-checkpoint id of one answer: the same input asked a different question is a new item."""
+    return hashlib.sha256(f"{source}\n{question}".encode("utf-8")).hexdigest()[:24]
+
+
+def load_completed_ids(output_path):
+    """Ids of records already written successfully to ``output_path`` (the resume checkpoint)."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line truncated by an interrupted run
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+
+def run_items(items, work, output_path, workers=4, progress=True):
+    """
+    Runs ``work`` over ``items`` on a thread pool, appending each result record to a JSONL file.
+
+    Args:
+        items (list): ``(item_id, payload)`` pairs still to process.
+        work (callable): Called with a payload; returns a dict merged into the record.
+        output_path (str): JSONL file that doubles as the resume checkpoint.
+        workers (int): Maximum concurrent items.
+        progress (bool): Whether to print progress to stderr.
+
+    Returns:
+        ProgressReporter: Counts of processed, failed and cached items.
+    """
+    reporter = ProgressReporter(len(items), enabled=progress)
+
+    def run(item_id, payload):
+        started = time.monotonic()
+        try:
+            record = {"id": item_id, "status": "ok", **work(payload)}
+        except Exception as e:
+            record = {"id": item_id, "status": "error", "error": str(e)}
+        record["elapsed"] = round(time.monotonic() - started, 3)
+        return record
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        with open(output_path, "a", encoding="utf-8") as output:
+            futures = [executor.submit(run, item_id, payload) for item_id, payload in items]
+            for future in as_completed(futures):
+                record = future.result()
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                reporter.update(record)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return reporter
+
+
+def write_markdown(output_path, markdown_path):
+    """Renders every successful record in the JSONL output as a Markdown report."""
+    records = {}
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                records[record["id"]] = record
+
+    with open(markdown_path, "w", encoding="utf-8") as f:
+        for record in sorted(records.values(), key=lambda r: (r.get("source", ""), r.get("question", ""))):
+            f.write(f"## {record.get('source', record['id'])}\n\n")
+            if record.get("question"):
+                f.write(f"**Question:** {record['question']}\n\n")
+            f.write(f"{record['response']}\n\n")
+
+
+def load_image_file(path):
+    with Image.open(path) as image:
+        return image.convert("RGB")
+
+
+def load_zip_member(zip_path, member):
+    with ZipFile(zip_path, "r") as zip_ref, zip_ref.open(member) as stream:
+        with Image.open(stream) as image:
+            return image.convert("RGB")
+
+
+def iter_image_inputs(paths):
+    """Yields ``(item_id, loader)`` for every image in the given files, directories and ZIPs."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file in sorted(files):
+                    if file.lower().endswith(IMAGE_EXTENSIONS):
+                        file_path = os.path.join(root, file)
+                        yield file_path, partial(load_image_file, file_path)
+        elif is_zipfile(path):
+            with ZipFile(path, "r") as zip_ref:
+                members = [info.filename for info in zip_ref.infolist() if is_image_member(info)]
+            for member in members:
+                yield f"{path}::{member}", partial(load_zip_member, path, member)
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            yield path, partial(load_image_file, path)
+
+
+def run_image_batch(paths, question, output_path, api_key, model_name="gpt-4o-mini", base_url=None, workers=4,
+                    markdown_path=None, progress=True):
+    """Asks ``question`` about every image under ``paths``, writing one JSONL record per image."""
+    from image_info_generator import ImageInfoGenerator
+
+    generator = ImageInfoGenerator(model_name=model_name, api_key=api_key, base_url=base_url)
+    completed = load_completed_ids(output_path)
+
+    def work(payload):
+        source, loader = payload
+        description, cache_hit = generator.describe_image(loader(), question)
+        return {"kind": "image", "source": source, "question": question, "response": description, "cached": cache_hit}
+
+    items = []
+    for source, loader in iter_image_inputs(paths):
+        item_id = make_item_id(source, question)
+        if item_id not in completed:
+            items.append((item_id, (source, loader)))
+    reporter = run_items(items, work, output_path, workers, progress)
+    if markdown_path:
+        write_markdown(output_path, markdown_path)
+    return reporter
+
+
+def run_web_batch(urls, questions, output_path, api_key, model_name="gpt-4o-mini", base_url=None, workers=4,
+                  per_url=False, markdown_path=None, progress=True):
+    """
+    Answers every question against the pages at ``urls``, writing one JSONL record per answer.
+
+    By default all URLs (and sitemaps) are indexed together; with ``per_url`` each URL gets
+    its own index and every question is asked once per URL. Groups are crawled concurrently
+    (up to ``workers`` at a time); each question waits only for its own group's index.
+    """
+    from services import Services
+
+    generator = Services(api_key, base_url=base_url, model_name=model_name).web_generator
+    completed = load_completed_ids(output_path)
+    groups = [[url] for url in urls] if per_url else [list(urls)]
+
+    crawler = ThreadPoolExecutor(max_workers=workers)
+    items = []
+    for group in groups:
+        site_key = generator.site_key(group)
+        pending = []
+        for question in questions:
+            item_id = make_item_id(site_key, question)
+            if item_id not in completed:
+                pending.append((item_id, question))
+        if not pending:
+            continue
+
+        crawl = crawler.submit(generator.load_or_crawl_vector_store, group)
+        for item_id, question in pending:
+            items.append((item_id, (site_key, crawl, question)))
+
+    def work(payload):
+        site_key, crawl, question = payload
+        vector_store, _ = crawl.result()
+        if vector_store is None:
+            raise RuntimeError("Failed to load documents from the specified URL.")
+        documents = generator.retrieve(question, vector_store)
+        response, cache_hit = generator.answer(question, documents)
+        return {"kind": "web", "source": site_key, "question": question, "response": response, "cached": cache_hit,
+                "sources": sorted({doc.metadata.get("source", "") for doc in documents})}
+
+    try:
+        reporter = run_items(items, work, output_path, workers, progress)
+    finally:
+        crawler.shutdown(wait=False, cancel_futures=True)
+    if markdown_path:
+        write_markdown(output_path, markdown_path)
+    return reporter
+
+
+def expand_arguments(values):
+    """Expands ``@file`` arguments into the non-empty, non-comment lines of that file."""
+    expanded = []
+    for value in values:
+        if value.startswith("@"):
+            with open(value[1:], "r", encoding="utf-8") as f:
+                expanded.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+        else:
+            expanded.append(value)
+    return expanded
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate test-case responses in batch without the Streamlit UI.")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"),
+                        help="API key (defaults to $OPENAI_API_KEY)")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"),
+                        help="OpenAI-compatible endpoint, e.g. a local fake server")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("-o", "--output", required=True, help="JSONL results file (also the resume checkpoint)")
+    parser.add_argument("--markdown", help="Also write a Markdown report of all results")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent requests")
+    parser.add_argument("--quiet", action="store_true", help="Do not print progress")
+    parser.add_argument("--metrics-json", help="Write per-stage timings, token counts and cache hit rates here")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    images = subparsers.add_parser("images", help="Describe images from files, directories or ZIP archives")
+    images.add_argument("paths", nargs="+")
+    images.add_argument("--question", default="", help="Question to ask about every image")
+
+    web = subparsers.add_parser("web", help="Answer questions about web pages, URL lists or sitemaps")
+    web.add_argument("urls", nargs="+", help="URLs, sitemap.xml URLs, or @file with one URL per line")
+    web.add_argument("--question", action="append", default=[], help="Question to ask (repeatable)")
+    web.add_argument("--questions-file", help="File with one question per line")
+    web.add_argument("--per-url", action="store_true", help="Index and query each URL separately")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.api_key:
+        print("API key is required for generating responses (use --api-key or $OPENAI_API_KEY).", file=sys.stderr)
+        return 2
+
+    common = dict(output_path=args.output, api_key=args.api_key, model_name=args.model, base_url=args.base_url,
+                  workers=args.workers, markdown_path=args.markdown, progress=not args.quiet)
+    if args.command == "images":
+        reporter = run_image_batch(args.paths, args.question, **common)
+    else:
+        questions = list(args.question)
+        if args.questions_file:
+            questions.extend(expand_arguments([f"@{args.questions_file}"]))
+        if not questions:
+            print("At least one --question or --questions-file is required.", file=sys.stderr)
+            return 2
+        reporter = run_web_batch(expand_arguments(args.urls), questions, per_url=args.per_url, **common)
+
+    print(f"Processed {reporter.done} item(s): {reporter.errors} error(s), {reporter.cached} served from cache.",
+          file=sys.stderr)
+    if args.metrics_json:
+        with open(args.metrics_json, "w", encoding="utf-8") as f:
+            json.dump(get_metrics().snapshot(), f, indent=2)
+    return 1 if reporter.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
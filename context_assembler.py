@@ -0,0 +1,140 @@
+# context_assembler.py
+"""
+Token-budgeted packing of retrieved chunks into a prompt context.
+
+Tokens are counted with tiktoken when its encoding can be loaded. tiktoken downloads the BPE
+file on first use; air-gapped deployments that want exact counts should pre-populate a
+directory with it and point ``TIKTOKEN_CACHE_DIR`` there. Otherwise counting falls back to an
+estimate of ~4 characters per token.
+"""
+import logging
+import re
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # Optional: fall back to a character-based estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODING = "cl100k_base"
+_fallback_logged = False
+
+
+@lru_cache(maxsize=8)
+def get_encoding(model_name=None):
+    """tiktoken encoding for ``model_name``, or None if it cannot be loaded."""
+    global _fallback_logged
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name) if model_name else tiktoken.get_encoding(DEFAULT_ENCODING)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        # Typically no network to download the BPE file; see TIKTOKEN_CACHE_DIR above
+        if not _fallback_logged:
+            _fallback_logged = True
+            logger.warning("Could not load the tiktoken encoding (%s); estimating ~4 characters per token", e)
+        return None
+
+
+def count_tokens(text, model_name=None):
+    """Counts tokens locally with tiktoken, or estimates ~4 characters per token without it."""
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model_name=None):
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def shingles(text, size=5):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class ContextAssembler:
+    """
+    Packs retrieved chunks into a prompt context under a fixed token budget.
+
+    Chunks are taken in retrieval (score) order. Text that overlaps an already selected
+    chunk of the same page is trimmed, near-duplicate passages are skipped, and packing
+    stops once the budget is reached, so every request has a bounded size.
+
+    Args:
+        max_tokens (int): Token budget for the whole context.
+        model_name (str): Model whose tokenizer is used for counting.
+        duplicate_threshold (float): Share of a chunk's word shingles already present in the
+            selected context above which the chunk is dropped as a near-duplicate.
+        separator (str): Text placed between passages.
+    """
+
+    def __init__(self, max_tokens=3000, model_name=None, duplicate_threshold=0.8, separator="\n\n"):
+        self.max_tokens = max_tokens
+        self.model_name = model_name
+        self.duplicate_threshold = duplicate_threshold
+        self.separator = separator
+
+    def _trim_overlap(self, doc, selected_ranges):
+        """Drops the leading characters of ``doc`` already covered by a selected chunk of the same page."""
+        text = doc.page_content
+        start = doc.metadata.get("start_index")
+        if start is None:
+            return text
+        source = doc.metadata.get("source")
+        end = start + len(text)
+        for other_source, other_start, other_end in selected_ranges:
+            if other_source != source or other_end <= start or other_start >= end:
+                continue
+            if other_start <= start:
+                text = text[min(len(text), other_end - start):]
+                start = other_end
+            elif other_end >= end:
+                text = text[:max(0, other_start - start)]
+                end = other_start
+        return text.strip()
+
+    def assemble(self, documents):
+        """Returns the context string for ``documents`` (assumed best-first)."""
+        passages = []
+        selected_ranges = []
+        seen_shingles = set()
+        used_tokens = 0
+        separator_tokens = count_tokens(self.separator, self.model_name)
+
+        for doc in documents:
+            text = self._trim_overlap(doc, selected_ranges)
+            if not text:
+                continue
+            doc_shingles = shingles(text)
+            if doc_shingles and len(doc_shingles & seen_shingles) / len(doc_shingles) >= self.duplicate_threshold:
+                continue
+
+            tokens = count_tokens(text, self.model_name) + (separator_tokens if passages else 0)
+            remaining = self.max_tokens - used_tokens
+            if tokens > remaining:
+                if passages:
+                    continue  # A smaller, lower-ranked chunk may still fit
+                text = truncate_to_tokens(text, remaining, self.model_name)
+                tokens = remaining
+
+            passages.append(text)
+            used_tokens += tokens
+            seen_shingles |= doc_shingles
+            start = doc.metadata.get("start_index")
+            if start is not None:
+                selected_ranges.append((doc.metadata.get("source"), start, start + len(doc.page_content)))
+            if used_tokens >= self.max_tokens:
+                break
+
+        return self.separator.join(passages)
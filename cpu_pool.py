@@ -0,0 +1,58 @@
+# cpu_pool.py
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+
+def default_workers():
+    """Cores this process may run on (respects CPU affinity, e.g. container cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def chunked(items, size):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def map_chunks(function, chunks, *args, executor=None):
+    """
+    Runs ``function(chunk, *args)`` for every chunk and yields ``(chunk_index, result)`` as chunks finish.
+
+    Chunks run on ``executor`` when given, otherwise inline, in order. Chunks that have not
+    started yet are cancelled if the caller stops iterating (e.g. a cancelled job).
+    """
+    if executor is None:
+        for index, chunk in enumerate(chunks):
+            yield index, function(chunk, *args)
+        return
+
+    futures = {executor.submit(function, chunk, *args): index for index, chunk in enumerate(chunks)}
+    try:
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def create_cpu_pool(workers, start_method=None):
+    """Returns a process pool with ``workers`` processes, or None (run inline) when ``workers`` is 0."""
+    if workers <= 0:
+        return None
+    if start_method is None:
+        # Forking a process that already runs server and HTTP client threads is unsafe
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method))
+
+
+@lru_cache(maxsize=None)
+def get_cpu_pool():
+    """
+    Process-wide worker pool for CPU-bound stages (thumbnailing, HTML parsing, PDF layout).
+
+    ``CPU_WORKERS`` sets its size (default: one process per available core); 0 disables it,
+    in which case this returns None and callers run the work inline.
+    """
+    return create_cpu_pool(int(os.environ.get("CPU_WORKERS", default_workers())))
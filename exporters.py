@@ -0,0 +1,170 @@
+# exporters.py
+import csv
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from docx import Document
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+from metrics import get_metrics
+from structured_output import TEST_CASE_FIELDS, to_rows
+
+PDF_MIME_TYPE = "application/pdf"
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+CSV_MIME_TYPE = "text/csv"
+JSON_MIME_TYPE = "application/json"
+XLSX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_export_cache = OrderedDict()  # (format, content hash) -> bytes
+_export_lock = threading.Lock()
+EXPORT_CACHE_SIZE = 32
+
+
+def content_hash(text, related_chunks=None):
+    payload = json.dumps({"text": text, "related": related_chunks}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _text_flowables(text, style, spacer_height=6):
+    flowables = []
+    for line in text.splitlines():
+        if line.strip():
+            # Paragraph wraps long lines to the frame width instead of running off the page
+            flowables.append(Paragraph(escape(line), style))
+        else:
+            flowables.append(Spacer(1, spacer_height))
+    return flowables
+
+
+def build_pdf(text, related_chunks=None):
+    """Lays out the response (and related information, if given) as a wrapped, paginated PDF."""
+    styles = getSampleStyleSheet()
+    body = styles["BodyText"]
+    heading = styles["Heading2"]
+
+    pdf_buffer = BytesIO()
+    document = SimpleDocTemplate(pdf_buffer, pagesize=letter, leftMargin=40, rightMargin=40,
+                                 topMargin=40, bottomMargin=40)
+    story = []
+    if related_chunks is not None:
+        story.append(Paragraph("Generated Response:", heading))
+    story.extend(_text_flowables(text, body))
+
+    if related_chunks:
+        story.append(Paragraph("Related Information:", heading))
+        for chunk in related_chunks:
+            story.append(Paragraph(f"<b>Title:</b> {escape(chunk['title'])}", body))
+            story.append(Paragraph(f"<b>Summary:</b> {escape(chunk['summary'])}", body))
+            story.append(Spacer(1, 6))
+
+    document.build(story)
+    return pdf_buffer.getvalue()
+
+
+def build_word_doc(text, related_chunks=None):
+    """Writes the response (and related information, if given) to a Word document."""
+    doc_buffer = BytesIO()
+    doc = Document()
+    if related_chunks is None:
+        doc.add_paragraph(text)
+    else:
+        doc.add_paragraph("Generated Response:")
+        doc.add_paragraph(text)
+        doc.add_paragraph("Related Information:")
+        for chunk in related_chunks:
+            doc.add_paragraph(f"Title: {chunk['title']}")
+            doc.add_paragraph(f"Summary: {chunk['summary']}")
+    doc.save(doc_buffer)
+    return doc_buffer.getvalue()
+
+
+def build_csv(test_cases):
+    """Test cases as CSV, one row per case with numbered steps, for test-management import."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=TEST_CASE_FIELDS)
+    writer.writeheader()
+    writer.writerows(to_rows(test_cases))
+    # The BOM makes Excel detect UTF-8
+    return buffer.getvalue().encode("utf-8-sig")
+
+
+def build_json(test_cases):
+    return json.dumps({"test_cases": test_cases}, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def build_xlsx(test_cases):
+    """Test cases as an Excel sheet (requires openpyxl)."""
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Font
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Test cases"
+    sheet.append(list(TEST_CASE_FIELDS))
+    for cell in sheet[1]:
+        cell.font = Font(bold=True)
+    for row in to_rows(test_cases):
+        sheet.append([row[field] for field in TEST_CASE_FIELDS])
+    for row in sheet.iter_rows(min_row=2):
+        for cell in row:
+            cell.alignment = Alignment(wrap_text=True, vertical="top")
+    for column, width in zip("ABCDEFG", (10, 40, 14, 10, 30, 60, 40)):
+        sheet.column_dimensions[column].width = width
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+BUILDERS = {"pdf": build_pdf, "docx": build_word_doc}
+TEST_CASE_BUILDERS = {"csv": build_csv, "json": build_json, "xlsx": build_xlsx}
+TEST_CASE_MIME_TYPES = {"csv": CSV_MIME_TYPE, "json": JSON_MIME_TYPE, "xlsx": XLSX_MIME_TYPE}
+
+
+def export(export_format, text, related_chunks=None, executor=None):
+    """
+    Returns the exported file as bytes, memoized by format and response content.
+
+    Args:
+        export_format (str): "pdf" or "docx".
+        text (str): The generated response.
+        related_chunks (list): Related information to append, or None for a plain export.
+        executor: Optional process pool (see ``cpu_pool``) that runs the layout off this interpreter.
+
+    Returns:
+        bytes: The exported document.
+    """
+    return _memoized_export((export_format, content_hash(text, related_chunks)), export_format,
+                            BUILDERS[export_format], (text, related_chunks), executor)
+
+
+def export_test_cases(export_format, test_cases):
+    """Returns structured test cases as "csv", "json" or "xlsx" bytes, memoized like ``export``."""
+    return _memoized_export((export_format, content_hash("", test_cases)), export_format,
+                            TEST_CASE_BUILDERS[export_format], (test_cases,))
+
+
+def _memoized_export(key, export_format, builder, args, executor=None):
+    with _export_lock:
+        data = _export_cache.get(key)
+        if data is not None:
+            _export_cache.move_to_end(key)
+    get_metrics().cache_lookup("export", data is not None)
+    if data is not None:
+        return data
+
+    with get_metrics().timer(f"export_{export_format}") as stage:
+        data = builder(*args) if executor is None else executor.submit(builder, *args).result()
+        stage["bytes"] = len(data)
+
+    with _export_lock:
+        _export_cache[key] = data
+        while len(_export_cache) > EXPORT_CACHE_SIZE:
+            _export_cache.popitem(last=False)
+    return data
@@ -0,0 +1,114 @@
+# gallery_cache.py
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class GalleryCache:
+    """Content-addressed LRU cache of prepared ZIP galleries, bounded by bytes on disk."""
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, root_dir=None):
+        self.max_bytes = max_bytes
+        self.root_dir = root_dir or tempfile.mkdtemp(prefix="gallery_cache_")
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._entries = OrderedDict()  # key -> (directory, gallery, size_in_bytes)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def hash_upload(uploaded_file, chunk_size=1024 * 1024):
+        """Returns the SHA-256 of a file-like upload without loading it into memory at once."""
+        digest = hashlib.sha256()
+        uploaded_file.seek(0)
+        for chunk in iter(lambda: uploaded_file.read(chunk_size), b""):
+            digest.update(chunk)
+        uploaded_file.seek(0)
+        return digest.hexdigest()
+
+    def spool_upload(self, uploaded_file, chunk_size=1024 * 1024):
+        """
+        Copies a file-like upload, chunk by chunk, to a new file under the cache directory.
+
+        Background jobs get the path instead of an in-memory copy of the archive, and the
+        gallery build can then move the file into place instead of copying it again.
+        """
+        fd, path = tempfile.mkstemp(prefix="upload_", suffix=".zip", dir=self.root_dir)
+        uploaded_file.seek(0)
+        with os.fdopen(fd, "wb") as spooled:
+            shutil.copyfileobj(uploaded_file, spooled, chunk_size)
+        uploaded_file.seek(0)
+        return path
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def get(self, key):
+        """Returns the cached gallery for ``key`` (marking it recently used), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def get_or_build(self, key, build):
+        """
+        Returns the cached gallery for ``key``, building the entry on a miss.
+
+        Args:
+            key (str): Content hash of the uploaded archive.
+            build (callable): Called with an empty directory; must write the gallery
+                files into it and return the gallery object to cache.
+
+        Returns:
+            The prepared gallery.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        directory = tempfile.mkdtemp(prefix=f"{key[:16]}_", dir=self.root_dir)
+        try:
+            gallery = build(directory)
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        with self._lock:
+            # Another session may have prepared the same archive concurrently
+            if key in self._entries:
+                shutil.rmtree(directory, ignore_errors=True)
+                self._entries.move_to_end(key)
+                return self._entries[key][1]
+
+            size = self._directory_size(directory)
+            self._entries[key] = (directory, gallery, size)
+            self._total_bytes += size
+            self._evict()
+        return gallery
+
+    def clear(self):
+        with self._lock:
+            for directory, _, _ in self._entries.values():
+                shutil.rmtree(directory, ignore_errors=True)
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _evict(self):
+        # Always keep the most recently added entry, even if it alone exceeds the budget
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (directory, _, size) = self._entries.popitem(last=False)
+            shutil.rmtree(directory, ignore_errors=True)
+            self._total_bytes -= size
+
+    @staticmethod
+    def _directory_size(directory):
+        total = 0
+        for root, _, files in os.walk(directory):
+            for file in files:
+                total += os.path.getsize(os.path.join(root, file))
+        return total
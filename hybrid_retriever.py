@@ -0,0 +1,169 @@
+# hybrid_retriever.py
+import hashlib
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.:/][a-z0-9]+)*")
+IDENTIFIER_PATTERN = re.compile(r"[0-9]|[-_.:/]")
+
+
+def tokenize(text):
+    """
+    Lowercased word tokens that keep identifiers intact.
+
+    Compound identifiers such as ``ERR-404`` or ``submit_btn`` are indexed both whole and
+    as their parts, so exact codes and their fragments both match.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[-_.:/]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def doc_key(doc):
+    """Identity of a chunk across the vector store and the BM25 index."""
+    content_hash = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+    return doc.metadata.get("source", ""), doc.metadata.get("start_index"), content_hash
+
+
+class BM25Index:
+    """In-memory inverted index with Okapi BM25 scoring."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(doc_position, term_frequency)]
+        self.lengths = []
+        for position, doc in enumerate(self.documents):
+            counts = Counter(tokenize(doc.page_content))
+            self.lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self.postings[term].append((position, frequency))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    @classmethod
+    def from_vector_store(cls, vector_store):
+        """Indexes every chunk held in a FAISS store's docstore."""
+        docstore = vector_store.docstore
+        return cls(docstore.search(doc_id) for doc_id in vector_store.index_to_docstore_id.values())
+
+    def idf(self, term):
+        document_frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.documents) - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def search(self, query, k=20):
+        """Returns up to ``k`` ``(document, score)`` pairs, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for position, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / (self.average_length or 1))
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[position], score) for position, score in best]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuses several ranked document lists; returns documents ordered by fused score."""
+    scores = defaultdict(float)
+    documents = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc_key(doc)
+            documents.setdefault(key, doc)
+            scores[key] += 1.0 / (k + rank + 1)
+    return [documents[key] for key, _ in sorted(scores.items(), key=lambda item: item[1], reverse=True)]
+
+
+class TermOverlapReranker:
+    """
+    Cheap CPU reranker: favours chunks containing the query's exact terms and identifiers.
+
+    Identifiers (terms with digits or separators, e.g. ``AUTH-401`` or ``signup_password``)
+    weigh ``identifier_weight`` times a plain word, so near-miss pages that share only the
+    surrounding wording rank below the chunk naming the exact code or field. Candidates keep
+    their fused order as a tie-breaker, so it only reorders when the lexical evidence is
+    clearly stronger.
+    """
+
+    def __init__(self, identifier_weight=2.0):
+        self.identifier_weight = identifier_weight
+
+    def term_weight(self, term):
+        return self.identifier_weight if IDENTIFIER_PATTERN.search(term) else 1.0
+
+    def rerank(self, query, documents):
+        query_weights = {term: self.term_weight(term) for term in tokenize(query)}
+        if not query_weights:
+            return documents
+        total = sum(query_weights.values())
+
+        def score(item):
+            position, doc = item
+            doc_terms = set(tokenize(doc.page_content))
+            overlap = sum(weight for term, weight in query_weights.items() if term in doc_terms) / total
+            return overlap - 0.01 * position
+
+        return [doc for _, doc in sorted(enumerate(documents), key=score, reverse=True)]
+
+
+class CrossEncoderReranker:
+    """Reranks with a small local cross-encoder (requires the optional sentence-transformers package)."""
+
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def rerank(self, query, documents):
+        if not documents:
+            return documents
+        scores = self.model.predict([(query, doc.page_content) for doc in documents])
+        return [doc for _, doc in sorted(zip(scores, documents), key=lambda item: item[0], reverse=True)]
+
+
+def create_reranker(name):
+    """Returns the reranker for ``name`` ("none", "overlap" or "cross-encoder")."""
+    if not name or name == "none":
+        return None
+    if name == "overlap":
+        return TermOverlapReranker()
+    if name == "cross-encoder":
+        return CrossEncoderReranker()
+    raise ValueError(f"Unknown reranker: {name}")
+
+
+class HybridRetriever:
+    """
+    Fuses BM25 keyword hits with FAISS similarity hits, then optionally reranks.
+
+    Args:
+        vector_store: A FAISS vector store.
+        k (int): Number of chunks returned.
+        fetch_k (int): Candidates taken from each retriever before fusion.
+        reranker: Object with ``rerank(query, documents)``, or None.
+        bm25_index (BM25Index): Prebuilt keyword index; built from the store's docstore if omitted.
+    """
+
+    def __init__(self, vector_store, k=4, fetch_k=20, reranker=None, bm25_index=None):
+        self.vector_store = vector_store
+        self.k = k
+        self.fetch_k = fetch_k
+        self.reranker = reranker
+        self.bm25_index = bm25_index or BM25Index.from_vector_store(vector_store)
+
+    def invoke(self, query):
+        vector_hits = self.vector_store.similarity_search(query, k=self.fetch_k)
+        keyword_hits = [doc for doc, _ in self.bm25_index.search(query, k=self.fetch_k)]
+        candidates = reciprocal_rank_fusion([vector_hits, keyword_hits])[:self.fetch_k]
+        if self.reranker is not None:
+            candidates = self.reranker.rerank(query, candidates)
+        return candidates[:self.k]
@@ -0,0 +1,65 @@
+# image_composite.py
+import math
+from PIL import Image, ImageDraw
+
+# High-detail vision pricing: a base cost plus a fixed cost per 512px tile
+BASE_IMAGE_TOKENS = 85
+TOKENS_PER_TILE = 170
+TILE_SIZE = 512
+
+
+def model_size(size, max_side=2048, max_short_side=768):
+    """Size the model actually processes after its own 2048px / 768px-short-side rescaling."""
+    width, height = size
+    scale = min(1.0, max_side / max(width, height), max_short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def estimate_image_tokens(size, max_side=2048, max_short_side=768):
+    width, height = model_size(size, max_side, max_short_side)
+    return BASE_IMAGE_TOKENS + TOKENS_PER_TILE * math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+
+
+def fit_to_token_budget(image, max_tokens, max_side=2048, max_short_side=768):
+    """Downscales ``image`` until its estimated token cost fits ``max_tokens`` (or it is one tile)."""
+    width, height = model_size(image.size, max_side, max_short_side)
+    while estimate_image_tokens((width, height), max_side, max_short_side) > max_tokens and max(width, height) > TILE_SIZE:
+        width, height = max(1, int(width * 0.8)), max(1, int(height * 0.8))
+    if (width, height) == image.size:
+        return image
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def build_mosaic(images, labels, cell_size=(768, 768), columns=None, padding=8):
+    """
+    Tiles several screenshots into one labelled grid image.
+
+    Args:
+        images (list): PIL images, in flow order.
+        labels (list): Text drawn in the top-left corner of each cell (e.g. the step number).
+        cell_size (tuple): Maximum width and height of each cell.
+        columns (int): Grid columns; defaults to a near-square layout.
+        padding (int): Gap between cells in pixels.
+
+    Returns:
+        PIL.Image.Image: The RGB mosaic, read left to right, top to bottom.
+    """
+    columns = columns or math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    cell_width, cell_height = cell_size
+    mosaic = Image.new(
+        "RGB",
+        (columns * cell_width + (columns + 1) * padding, rows * cell_height + (rows + 1) * padding),
+        "white",
+    )
+    draw = ImageDraw.Draw(mosaic)
+    for position, (image, label) in enumerate(zip(images, labels)):
+        cell = image.convert("RGB")
+        cell.thumbnail(cell_size, Image.LANCZOS)
+        x = padding + (position % columns) * (cell_width + padding)
+        y = padding + (position // columns) * (cell_height + padding)
+        mosaic.paste(cell, (x, y))
+        text_box = draw.textbbox((x, y), label)
+        draw.rectangle((text_box[0] - 2, text_box[1] - 2, text_box[2] + 4, text_box[3] + 4), fill="black")
+        draw.text((x + 1, y + 1), label, fill="yellow")
+    return mosaic
@@ -0,0 +1,59 @@
+# image_dedup.py
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+DEFAULT_THRESHOLD = 6  # Max differing bits (of 64) for two screenshots to count as near-duplicates
+
+
+def hash_pixels(images, hash_size=HASH_SIZE):
+    """
+    Difference hashes (dHash) for a batch of images, computed in one vectorized pass.
+
+    Args:
+        images (list): PIL images of any size and mode.
+        hash_size (int): Hash grid size; 8 gives 64-bit hashes.
+
+    Returns:
+        numpy.ndarray: One ``uint64`` hash per image.
+    """
+    if not images:
+        return np.zeros(0, dtype=np.uint64)
+    pixels = np.stack([
+        np.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+        for image in images
+    ])
+    # Each bit records whether brightness increases from one column to the next
+    bits = (pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(len(images), -1)
+    packed = np.packbits(bits, axis=1)
+    return packed.view(">u8").astype(np.uint64).ravel()
+
+
+def hamming_distances(hashes, target):
+    """Number of differing bits between every hash in ``hashes`` and ``target``."""
+    xor = np.bitwise_xor(hashes, np.uint64(target))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def cluster_hashes(hashes, threshold=DEFAULT_THRESHOLD):
+    """
+    Groups near-identical images by leader clustering over their hashes.
+
+    Images are visited in order; an image not yet assigned becomes the representative of a
+    new cluster that takes every unassigned image within ``threshold`` bits of it.
+
+    Returns:
+        list: Clusters as lists of indices; each cluster's first index is its representative.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    assigned = np.zeros(len(hashes), dtype=bool)
+    clusters = []
+    for index in range(len(hashes)):
+        if assigned[index]:
+            continue
+        members = np.flatnonzero(~assigned & (hamming_distances(hashes, hashes[index]) <= threshold))
+        assigned[members] = True
+        clusters.append(members.tolist())
+    return clusters
@@ -2,42 +2,305 @@
 from langchain.chat_models import ChatOpenAI
 from langchain.schema.messages import HumanMessage, AIMessage
 import base64
-import tempfile
+import hashlib
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from io import BytesIO
 from PIL import Image
+from context_assembler import count_tokens
+from metrics import get_metrics, message_token_count
+from response_cache import get_response_cache, make_cache_key
+from image_composite import build_mosaic, fit_to_token_budget
+from structured_output import STRUCTURED_OUTPUT_INSTRUCTIONS, TestCaseStreamParser
+
+# OpenAI vision models fit images into a 2048px square, then scale the shortest side to 768px
+MAX_IMAGE_SIDE = 2048
+MAX_SHORT_SIDE = 768
+IMAGE_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+DEFAULT_PROMPT = "Identify all items in this image and provide a list of what you see."
+DEFAULT_FLOW_PROMPT = "Write end-to-end test cases that cover this user flow, step by step."
+DEFAULT_TEST_CASE_PROMPT = "Write test cases for the functionality shown on this screen."
+SYSTEM_PROMPT = (
+    "You are a highly skilled business analyst. Based on your expertise in analyzing data, "
+    "interpreting business requirements, and understanding complex processes, examine the provided context. "
+    "Deliver a detailed analysis that outlines key insights, identifies potential risks, and highlights any "
+    "opportunities for improvement. Provide a structured response, including specific recommendations or steps for "
+    "optimization where applicable. Present your findings in a clear and actionable format to support data-driven "
+    "decision-making."
+)
+
+
+def is_rate_limit_error(error):
+    """True for provider errors that signal throttling (HTTP 429 / RateLimitError)."""
+    if type(error).__name__ == "RateLimitError":
+        return True
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status_code == 429
 
 
 class ImageInfoGenerator:
-    def __init__(self, model_name="gpt-4o-mini", temperature=0.5, api_key=None):
-        # Initialize the ChatOpenAI model with an API key if provided
-        self.model = ChatOpenAI(model=model_name, max_tokens=1024, openai_api_key=api_key)
+    def __init__(self, model_name="gpt-4o-mini", temperature=0.5, api_key=None, image_format="JPEG",
+                 image_quality=85, max_image_side=MAX_IMAGE_SIDE, max_short_side=MAX_SHORT_SIDE,
+                 encode_cache_size=64, response_cache=None, base_url=None, http_client=None,
+                 max_images_per_request=10, flow_image_token_budget=8000, metrics=None, chat_model=None):
+        # Initialize the ChatOpenAI model with an API key if provided; chat_model substitutes any
+        # compatible chat model (e.g. the offline fake used by benchmark.py)
+        self.model = chat_model or ChatOpenAI(model=model_name, max_tokens=1024, openai_api_key=api_key,
+                                              openai_api_base=base_url, http_client=http_client)
 
-    def encode_image(self, image):
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_image:
-            image.save(temp_image.name)
-            with open(temp_image.name, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode("utf-8")
+        image_format = image_format.upper()
+        if image_format not in IMAGE_MIME_TYPES:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self.image_format = image_format
+        self.image_quality = image_quality
+        self.max_image_side = max_image_side
+        self.max_short_side = max_short_side
+        self.encode_cache_size = encode_cache_size
+        self._encode_cache = OrderedDict()
+        self._encode_lock = threading.Lock()
+        self.response_cache = response_cache or get_response_cache()
+        self.max_images_per_request = max_images_per_request
+        self.flow_image_token_budget = flow_image_token_budget
+        self.metrics = metrics or get_metrics()
 
-    def generate_image_description(self, image, question):
-        base64_image = self.encode_image(image)
-        prompt = question if question else "Identify all items in this image and provide a list of what you see."
+    @property
+    def image_mime_type(self):
+        return IMAGE_MIME_TYPES[self.image_format]
 
-        try:
-            msg = self.model.invoke(
-                [
-                    AIMessage(content="You are a highly skilled business analyst. Based on your expertise in analyzing data, "
-                                      "interpreting business requirements, and understanding complex processes, examine the provided context. "
-                                      "Deliver a detailed analysis that outlines key insights, identifies potential risks, and highlights any "
-                                      "opportunities for improvement. Provide a structured response, including specific recommendations or steps for "
-                                      "optimization where applicable. Present your findings in a clear and actionable format to support data-driven "
-                                      "decision-making."),
-                    HumanMessage(
-                        content=[
-                            {"type": "text", "text": prompt},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                        ]
-                    )
+    @staticmethod
+    def image_hash(image):
+        """Returns a content hash of the decoded pixels, independent of the source file."""
+        digest = hashlib.sha256()
+        digest.update(f"{image.mode}:{image.size}".encode("utf-8"))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def resize_for_model(self, image):
+        """Downscales the image to the largest resolution the model actually looks at."""
+        width, height = image.size
+        scale = min(1.0, self.max_image_side / max(width, height), self.max_short_side / min(width, height))
+        if scale >= 1.0:
+            return image
+        new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return image.resize(new_size, Image.LANCZOS)
+
+    def encode_image(self, image, image_hash=None):
+        cache_key = image_hash or self.image_hash(image)
+        with self._encode_lock:
+            encoded = self._encode_cache.get(cache_key)
+            if encoded is not None:
+                self._encode_cache.move_to_end(cache_key)
+        self.metrics.cache_lookup("image_encode", encoded is not None)
+        if encoded is not None:
+            return encoded
+
+        with self.metrics.timer("image_convert") as stage:
+            resized = self.resize_for_model(image)
+            if resized.mode not in ("RGB", "L"):
+                resized = resized.convert("RGB")
+            buffer = BytesIO()
+            resized.save(buffer, format=self.image_format, quality=self.image_quality)
+            stage["bytes"] = buffer.tell()
+        with self.metrics.timer("base64_encode") as stage:
+            encoded = base64.b64encode(buffer.getvalue()).decode("utf-8")
+            stage["bytes"] = len(encoded)
+
+        with self._encode_lock:
+            self._encode_cache[cache_key] = encoded
+            while len(self._encode_cache) > self.encode_cache_size:
+                self._encode_cache.popitem(last=False)
+        return encoded
+
+    def build_messages(self, image, question, image_hash=None):
+        base64_image = self.encode_image(image, image_hash)
+        prompt = question if question else DEFAULT_PROMPT
+        return [
+            AIMessage(content=SYSTEM_PROMPT),
+            HumanMessage(
+                content=[
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:{self.image_mime_type};base64,{base64_image}"}}
                 ]
             )
-            return msg.content
-        except Exception as e:
-            return f"Error generating image description: {e}"
+        ]
+
+    def invoke_with_retry(self, messages, max_retries=5, base_delay=1.0, max_delay=30.0, stage="vision_request"):
+        """Invokes the model, backing off exponentially (with jitter) while the provider rate-limits us."""
+        for attempt in range(max_retries + 1):
+            try:
+                with self.metrics.timer(stage) as timing:
+                    msg = self.model.invoke(messages)
+                    timing["tokens"] = message_token_count(msg)
+                return msg
+            except Exception as e:
+                if attempt == max_retries or not is_rate_limit_error(e):
+                    raise
+                delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                self.metrics.observe("rate_limit_backoff", delay)
+                time.sleep(delay)
+
+    def response_cache_key(self, question, image_hash):
+        return make_cache_key(self.model.model_name, self.model.temperature, SYSTEM_PROMPT,
+                              question or DEFAULT_PROMPT, image_hash=image_hash)
+
+    def describe_image(self, image, question):
+        """Returns ``(description, cache_hit)``, raising if the model call fails; only successful answers are cached."""
+        image_hash = self.image_hash(image)
+        cache_key = self.response_cache_key(question, image_hash)
+        cached = self.response_cache.get(cache_key)
+        self.metrics.cache_lookup("image_response", cached is not None)
+        if cached is not None:
+            return cached, True
+
+        msg = self.invoke_with_retry(self.build_messages(image, question, image_hash))
+        self.response_cache.set(cache_key, msg.content)
+        return msg.content, False
+
+    def stream_structured(self, build_messages, cache_key, parser=None, stage="vision_test_cases"):
+        """
+        Streams a structured test-case response, yielding each validated case as soon as it is complete.
+
+        Args:
+            build_messages (callable): Returns the chat messages; only called on a cache miss.
+            cache_key (str): Response cache key of the request.
+            parser (TestCaseStreamParser): Collects the cases and validation errors.
+            stage (str): Metrics stage name for the model call.
+        """
+        parser = parser or TestCaseStreamParser()
+        cached = self.response_cache.get(cache_key)
+        self.metrics.cache_lookup("image_test_cases", cached is not None)
+        if cached is not None:
+            parser.from_cache = True
+            yield from parser.feed(cached)
+            return
+
+        messages = build_messages()
+        chunks = []
+        started = time.perf_counter()
+        for chunk in self.model.stream(messages):
+            chunks.append(chunk.content)
+            yield from parser.feed(chunk.content)
+        response = "".join(chunks)
+        # Streamed chunks carry no usage data; the completion is counted locally
+        self.metrics.observe(stage, time.perf_counter() - started, tokens=count_tokens(response))
+        if parser.cases:
+            self.response_cache.set(cache_key, response)
+
+    def stream_test_cases(self, image, question, parser=None):
+        """Yields structured test cases for one screen as they arrive (see ``stream_structured``)."""
+        image_hash = self.image_hash(image)
+        prompt = f"{question or DEFAULT_TEST_CASE_PROMPT}\n\n{STRUCTURED_OUTPUT_INSTRUCTIONS}"
+        cache_key = make_cache_key(self.model.model_name, self.model.temperature, SYSTEM_PROMPT, prompt,
+                                   image_hash=image_hash)
+        return self.stream_structured(lambda: self.build_messages(image, prompt, image_hash), cache_key, parser)
+
+    def stream_flow_test_cases(self, images, question, parser=None):
+        """Yields structured end-to-end test cases for an ordered flow of screens as they arrive."""
+        if not images:
+            raise ValueError("Select at least one image for the flow.")
+        prompt = f"{question or DEFAULT_FLOW_PROMPT}\n\n{STRUCTURED_OUTPUT_INSTRUCTIONS}"
+        cache_key = make_cache_key(self.model.model_name, self.model.temperature, SYSTEM_PROMPT, prompt,
+                                   image_hash=f"flow:{self.flow_hash(images)}")
+        return self.stream_structured(
+            lambda: self.build_flow_messages(self.prepare_flow_images(images), prompt), cache_key, parser,
+            stage="flow_vision_test_cases"
+        )
+
+    def prepare_flow_images(self, images):
+        """
+        Turns an ordered list of screens into at most ``max_images_per_request`` labelled images.
+
+        Screens beyond the model's per-request image limit are tiled into numbered mosaics, and
+        every resulting image is downscaled so the whole request fits the image token budget.
+
+        Returns:
+            list: ``(label, image)`` pairs in flow order.
+        """
+        count = len(images)
+        if count <= self.max_images_per_request:
+            parts = [(f"Step {i + 1}", image) for i, image in enumerate(images)]
+        else:
+            per_mosaic = math.ceil(count / self.max_images_per_request)
+            parts = []
+            for start in range(0, count, per_mosaic):
+                group = images[start:start + per_mosaic]
+                labels = [str(start + i + 1) for i in range(len(group))]
+                label = f"Steps {start + 1}-{start + len(group)} (numbered, left to right, top to bottom)"
+                parts.append((label, build_mosaic(group, labels)))
+
+        per_image_budget = self.flow_image_token_budget // len(parts)
+        return [(label, fit_to_token_budget(image, per_image_budget, self.max_image_side, self.max_short_side))
+                for label, image in parts]
+
+    def build_flow_messages(self, parts, question):
+        prompt = question if question else DEFAULT_FLOW_PROMPT
+        content = [{
+            "type": "text",
+            "text": f"The following {len(parts)} image(s) show consecutive screens of one user flow, in order. {prompt}"
+        }]
+        for label, image in parts:
+            content.append({"type": "text", "text": f"{label}:"})
+            content.append({"type": "image_url",
+                            "image_url": {"url": f"data:{self.image_mime_type};base64,{self.encode_image(image)}"}})
+        return [AIMessage(content=SYSTEM_PROMPT), HumanMessage(content=content)]
+
+    def flow_hash(self, images):
+        return hashlib.sha256("".join(self.image_hash(image) for image in images).encode("utf-8")).hexdigest()
+
+    def describe_flow(self, images, question):
+        """
+        Answers one question about an ordered flow of screens in a single model call.
+
+        Returns:
+            tuple: ``(description, cache_hit)``; raises if the model call fails.
+        """
+        if not images:
+            raise ValueError("Select at least one image for the flow.")
+        cache_key = make_cache_key(self.model.model_name, self.model.temperature, SYSTEM_PROMPT,
+                                   question or DEFAULT_FLOW_PROMPT, image_hash=f"flow:{self.flow_hash(images)}")
+        cached = self.response_cache.get(cache_key)
+        self.metrics.cache_lookup("flow_response", cached is not None)
+        if cached is not None:
+            return cached, True
+
+        msg = self.invoke_with_retry(self.build_flow_messages(self.prepare_flow_images(images), question),
+                                     stage="flow_vision_request")
+        self.response_cache.set(cache_key, msg.content)
+        return msg.content, False
+
+    def describe_images(self, images, question, max_workers=8):
+        """
+        Asks the same question about every image concurrently.
+
+        Args:
+            images (list): PIL images, or zero-argument callables returning one; callables
+                are resolved inside the worker so only ``max_workers`` images are decoded at once.
+            question (str): The question to ask about each image.
+            max_workers (int): Maximum number of requests in flight.
+
+        Yields:
+            tuple: ``(index, description)`` pairs in completion order.
+        """
+        def describe(image):
+            if callable(image):
+                try:
+                    image = image()
+                except Exception as e:
+                    return f"Error loading image: {e}"
+            try:
+                return self.describe_image(image, question)[0]
+            except Exception as e:
+                return f"Error generating image description: {e}"
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {executor.submit(describe, image): index for index, image in enumerate(images)}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # Drop queued requests if the caller stops early (e.g. a Streamlit rerun)
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,232 @@
+# index_store.py
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import faiss
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_community.vectorstores import FAISS
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "WEB_INDEX_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai_testcase_generator")
+)
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+PRUNE_INTERVAL_SECONDS = 60 * 60
+
+
+def url_key(url):
+    return hashlib.sha256(url.strip().encode("utf-8")).hexdigest()[:32]
+
+
+def documents_hash(documents):
+    """Content hash of loaded pages, stable across processes and runs."""
+    digest = hashlib.sha256()
+    for doc in documents:
+        digest.update(str(doc.metadata.get("source", "")).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(doc.page_content.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def manifest_hash(manifest):
+    """Order-independent content hash of an index manifest (``url -> {"page_hash": ...}``)."""
+    page_hashes = sorted(f"{source}:{entry['page_hash']}" for source, entry in manifest.items())
+    return hashlib.sha256("\n".join(page_hashes).encode("utf-8")).hexdigest()
+
+
+class IndexStore:
+    """
+    On-disk store of embeddings and FAISS indexes shared by every session and process.
+
+    Embeddings are cached by model and text hash, so identical chunks are never embedded
+    twice. Indexes are saved per URL and content hash and reloaded memory-mapped, with a
+    small in-process cache so concurrent sessions share the same index in memory.
+
+    An index is fresh for ``ttl_seconds`` after it was built or verified by a refresh; reading
+    it does not extend that. Indexes unused for longer than the TTL are deleted by ``prune``,
+    which ``save`` runs at most every ``prune_interval_seconds``.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl_seconds=DEFAULT_TTL_SECONDS, max_loaded_indexes=16,
+                 prune_interval_seconds=PRUNE_INTERVAL_SECONDS):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_loaded_indexes = max_loaded_indexes
+        self.prune_interval_seconds = prune_interval_seconds
+        self._embedding_store = LocalFileStore(os.path.join(cache_dir, "embeddings"))
+        self._loaded = OrderedDict()  # (url_key, content_hash) -> FAISS
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        os.makedirs(os.path.join(cache_dir, "indexes"), exist_ok=True)
+
+    def cached_embeddings(self, embeddings):
+        """Wraps an embeddings model so document vectors are read from and written to the disk cache."""
+        namespace = getattr(embeddings, "model", None) or type(embeddings).__name__
+        return CacheBackedEmbeddings.from_bytes_store(embeddings, self._embedding_store, namespace=namespace)
+
+    def _url_dir(self, url):
+        return os.path.join(self.cache_dir, "indexes", url_key(url))
+
+    def _index_dir(self, url, content_hash):
+        return os.path.join(self._url_dir(url), content_hash)
+
+    def _read_latest(self, url):
+        try:
+            with open(os.path.join(self._url_dir(url), "latest.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_latest(self, url, content_hash):
+        url_dir = self._url_dir(url)
+        os.makedirs(url_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=url_dir, suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "content_hash": content_hash, "updated_at": time.time()}, f)
+        os.replace(temp_path, os.path.join(url_dir, "latest.json"))
+
+    def _mark_used(self, url):
+        # Last use is tracked apart from freshness, so reads keep an index from being pruned but never make it fresh
+        used_path = os.path.join(self._url_dir(url), "last_used")
+        try:
+            with open(used_path, "a"):
+                pass
+            os.utime(used_path)
+        except OSError:
+            pass
+
+    def _remember_loaded(self, key, vector_store):
+        with self._lock:
+            self._loaded[key] = vector_store
+            self._loaded.move_to_end(key)
+            while len(self._loaded) > self.max_loaded_indexes:
+                self._loaded.popitem(last=False)
+
+    def latest_content_hash(self, url):
+        """Content hash of the most recently saved index for ``url``, regardless of the TTL."""
+        latest = self._read_latest(url)
+        return latest["content_hash"] if latest else None
+
+    def load_manifest(self, url, content_hash):
+        """Returns the manifest saved with an index (page hashes and chunk ids), or None."""
+        try:
+            with open(os.path.join(self._index_dir(url, content_hash), "manifest.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def mark_verified(self, url, content_hash):
+        """Records that the index at ``content_hash`` was just checked against the live site and is current."""
+        self._write_latest(url, content_hash)
+
+    def load_fresh(self, url, embeddings):
+        """Returns the latest index for ``url`` if it was built or verified within the TTL, else None."""
+        latest = self._read_latest(url)
+        if not latest or time.time() - latest.get("updated_at", 0) > self.ttl_seconds:
+            return None
+        return self.load(url, latest["content_hash"], embeddings)
+
+    def load(self, url, content_hash, embeddings, writable=False):
+        """
+        Returns the saved index for ``url`` at ``content_hash`` bound to ``embeddings``, or None.
+
+        Shared indexes are read-only; pass ``writable=True`` to get a private in-memory copy
+        that can be modified (e.g. for incremental refresh) without affecting other sessions.
+        """
+        if writable:
+            index_dir = self._index_dir(url, content_hash)
+            if not os.path.exists(os.path.join(index_dir, "index.faiss")):
+                return None
+            return self._read_index(index_dir, embeddings, mmap=False)
+
+        key = (url_key(url), content_hash)
+        with self._lock:
+            vector_store = self._loaded.get(key)
+            if vector_store is not None:
+                self._loaded.move_to_end(key)
+
+        if vector_store is None:
+            index_dir = self._index_dir(url, content_hash)
+            if not os.path.exists(os.path.join(index_dir, "index.faiss")):
+                return None
+            vector_store = self._read_index(index_dir, embeddings)
+            self._remember_loaded(key, vector_store)
+
+        self._mark_used(url)
+        # Share the index and docstore, but embed queries with the caller's own client
+        return FAISS(embeddings, vector_store.index, vector_store.docstore, vector_store.index_to_docstore_id)
+
+    def save(self, url, content_hash, vector_store, manifest=None):
+        """Persists ``vector_store`` (and its manifest) atomically under ``url`` and ``content_hash``."""
+        index_dir = self._index_dir(url, content_hash)
+        url_dir = os.path.dirname(index_dir)
+        os.makedirs(url_dir, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(dir=url_dir, prefix=".tmp_")
+        try:
+            vector_store.save_local(temp_dir)
+            if manifest is not None:
+                with open(os.path.join(temp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+                    json.dump(manifest, f)
+            if os.path.exists(index_dir):
+                shutil.rmtree(index_dir, ignore_errors=True)
+            os.replace(temp_dir, index_dir)
+        except OSError:
+            # A concurrent writer won the race with an identical index
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        self._write_latest(url, content_hash)
+        self._mark_used(url)
+        self._remember_loaded((url_key(url), content_hash), vector_store)
+
+        now = time.time()
+        if now - self._last_prune >= self.prune_interval_seconds:
+            self._last_prune = now
+            self.prune()
+
+    def prune(self):
+        """Deletes saved indexes that have been neither saved nor used within the TTL."""
+        indexes_dir = os.path.join(self.cache_dir, "indexes")
+        cutoff = time.time() - self.ttl_seconds
+        for entry in os.listdir(indexes_dir):
+            url_dir = os.path.join(indexes_dir, entry)
+            last_activity = 0.0
+            for name in ("latest.json", "last_used"):
+                try:
+                    last_activity = max(last_activity, os.path.getmtime(os.path.join(url_dir, name)))
+                except OSError:
+                    continue
+            if last_activity and last_activity < cutoff:
+                shutil.rmtree(url_dir, ignore_errors=True)
+                with self._lock:
+                    for key in [key for key in self._loaded if key[0] == entry]:
+                        del self._loaded[key]
+
+    @staticmethod
+    def _read_index(index_dir, embeddings, mmap=True):
+        index_path = os.path.join(index_dir, "index.faiss")
+        index = None
+        if mmap:
+            try:
+                # Memory-map the vectors so processes serving the same URL share page cache
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                index = None
+        if index is None:
+            index = faiss.read_index(index_path)
+        with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+@lru_cache(maxsize=None)
+def get_index_store(cache_dir=DEFAULT_CACHE_DIR):
+    """Process-wide IndexStore for ``cache_dir``."""
+    return IndexStore(cache_dir)
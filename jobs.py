@@ -0,0 +1,154 @@
+# jobs.py
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work function once cancellation has been requested."""
+
+
+class Job:
+    """
+    One unit of background work and its observable state.
+
+    The work function receives the job as its first argument and reports progress through
+    ``update`` and ``append_output``; both raise ``JobCancelled`` after ``cancel`` so long
+    loops stop at their next checkpoint.
+    """
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.output = ""  # Partial text (e.g. a streamed answer) while the job runs
+        self.items = []  # Partial structured results (e.g. test cases) while the job runs
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_requested = threading.Event()
+        self._future = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_requested.is_set()
+
+    def check_cancelled(self):
+        if self._cancel_requested.is_set():
+            raise JobCancelled()
+
+    def update(self, progress=None, message=None):
+        """Records progress (0..1) and a status message."""
+        self.check_cancelled()
+        if progress is not None:
+            self.progress = min(1.0, max(0.0, progress))
+        if message is not None:
+            self.message = message
+
+    def append_output(self, text):
+        self.check_cancelled()
+        self.output += text
+
+    def append_item(self, item):
+        self.check_cancelled()
+        self.items.append(item)
+
+
+class JobManager:
+    """
+    Process-wide worker pool for long operations (crawls, indexing, model calls, exports).
+
+    Jobs outlive the Streamlit script run that submitted them: the page keeps only the job
+    id and polls for progress, so reruns and other users' requests never abort or block it.
+    Finished jobs are kept for ``retention_seconds`` so their results can be collected.
+    """
+
+    def __init__(self, max_workers=8, retention_seconds=60 * 60):
+        self.retention_seconds = retention_seconds
+        self.metrics = get_metrics()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, work, *args, **kwargs):
+        """Queues ``work(job, *args, **kwargs)`` and returns its Job."""
+        self.prune()
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+        job._future = self._executor.submit(self._run, job, work, args, kwargs)
+        return job
+
+    def _run(self, job, work, args, kwargs):
+        if job.cancel_requested:
+            job.status, job.finished_at = CANCELLED, time.time()
+            return
+        job.status, job.started_at = RUNNING, time.time()
+        self.metrics.observe("job_queue_wait", job.started_at - job.created_at)
+        try:
+            with self.metrics.timer(f"job_{job.kind}"):
+                result = work(job, *args, **kwargs)
+            if job.cancel_requested:
+                job.status = CANCELLED  # Finished after the user gave up on it; drop the result
+            else:
+                job.result, job.progress, job.status = result, 1.0, DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            logger.exception("Background %s job failed", job.kind)
+            job.error, job.status = str(e), FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Requests cancellation; a job that has not started yet is cancelled immediately."""
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return
+        job._cancel_requested.set()
+        if job._future is not None and job._future.cancel():
+            job.status, job.finished_at = CANCELLED, time.time()
+
+    def prune(self):
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job.finished_at is not None and job.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        for job_id in list(self._jobs):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+@lru_cache(maxsize=None)
+def get_job_manager():
+    """Process-wide job manager; ``JOB_WORKERS`` sets the number of worker threads (default 8)."""
+    return JobManager(max_workers=int(os.environ.get("JOB_WORKERS", 8)))
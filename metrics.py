@@ -0,0 +1,182 @@
+# metrics.py
+"""
+Lightweight in-process instrumentation: per-stage timings, bytes, token counts and cache hit rates.
+
+Stages (unzip, image conversion, page fetch, embedding, retrieval, LLM calls, exports...) are
+timed with ``get_metrics().timer(stage)``. Counters are process-wide, so they cover every
+Streamlit session and CLI worker thread. Set ``METRICS_LOG`` to a file path to also append
+one JSON line per event, and ``METRICS_PORT`` to serve the counters in Prometheus text format.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRIC_PREFIX = "testcase_generator"
+
+
+def message_token_count(message):
+    """Total tokens reported by the provider for a chat model response, or 0 if unknown."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens", 0)
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return token_usage.get("total_tokens", 0)
+
+
+class StageStats:
+    """Running totals for one instrumented stage."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.tokens = 0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "seconds": self.seconds,
+            "avg_seconds": self.seconds / self.count if self.count else 0.0,
+            "max_seconds": self.max_seconds,
+            "bytes": self.bytes,
+            "tokens": self.tokens,
+        }
+
+
+class Metrics:
+    """
+    Thread-safe registry of stage timings and cache lookups.
+
+    Args:
+        log_path (str): Optional JSON-lines file that receives every recorded event.
+    """
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self._stages = {}
+        self._caches = {}  # cache name -> [hits, misses]
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, stage, **fields):
+        """
+        Times the ``with`` block as one run of ``stage``.
+
+        The yielded dict may be filled with ``bytes``, ``tokens`` and ``error`` while the block
+        runs; an exception escaping the block is recorded as an error.
+        """
+        info = dict(fields)
+        started = time.perf_counter()
+        try:
+            yield info
+        except BaseException:
+            info["error"] = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started, info.get("bytes", 0), info.get("tokens", 0),
+                         info.get("error", False))
+
+    def observe(self, stage, seconds, bytes=0, tokens=0, error=False):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.count += 1
+            stats.errors += bool(error)
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.bytes += bytes or 0
+            stats.tokens += tokens or 0
+        self.log({"event": "stage", "stage": stage, "seconds": round(seconds, 6), "bytes": bytes or 0,
+                  "tokens": tokens or 0, "error": bool(error)})
+
+    def cache_lookup(self, cache, hit):
+        with self._lock:
+            counts = self._caches.setdefault(cache, [0, 0])
+            counts[0 if hit else 1] += 1
+        self.log({"event": "cache", "cache": cache, "hit": bool(hit)})
+
+    def log(self, event):
+        if not self.log_path:
+            return
+        line = json.dumps(dict(event, time=round(time.time(), 3)))
+        with self._log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def snapshot(self):
+        """Returns ``{"stages": {...}, "caches": {...}}`` with the current totals."""
+        with self._lock:
+            stages = {name: stats.as_dict() for name, stats in self._stages.items()}
+            caches = {
+                name: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+                for name, (hits, misses) in self._caches.items()
+            }
+        return {"stages": stages, "caches": caches}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._caches.clear()
+
+    def to_prometheus(self):
+        """Renders the totals in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        families = [
+            ("stage_runs_total", "counter", "Runs per stage, including failed ones.", "stages", "stage", "count"),
+            ("stage_errors_total", "counter", "Failed runs per stage.", "stages", "stage", "errors"),
+            ("stage_seconds_total", "counter", "Time spent per stage.", "stages", "stage", "seconds"),
+            ("stage_seconds_max", "gauge", "Slowest run per stage.", "stages", "stage", "max_seconds"),
+            ("stage_bytes_total", "counter", "Bytes handled per stage.", "stages", "stage", "bytes"),
+            ("stage_tokens_total", "counter", "Tokens used per stage.", "stages", "stage", "tokens"),
+            ("cache_hits_total", "counter", "Cache hits per cache.", "caches", "cache", "hits"),
+            ("cache_misses_total", "counter", "Cache misses per cache.", "caches", "cache", "misses"),
+        ]
+        lines = []
+        for name, kind, help_text, section, label, field in families:
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for key, values in sorted(snapshot[section].items()):
+                lines.append(f'{metric}{{{label}="{key}"}} {values[field]}')
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics, port, host="0.0.0.0"):
+    """Serves ``metrics`` at ``http://host:port/metrics`` from a daemon thread; returns the server."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes would otherwise flood stderr
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+@lru_cache(maxsize=None)
+def get_metrics():
+    """Process-wide metrics registry, configured from ``METRICS_LOG`` and ``METRICS_PORT``."""
+    metrics = Metrics(log_path=os.environ.get("METRICS_LOG"))
+    port = os.environ.get("METRICS_PORT")
+    if port:
+        serve_metrics(metrics, int(port))
+    return metrics
@@ -1,23 +1,32 @@
 import streamlit as st
-from PIL import Image
-from image_info_generator import ImageInfoGenerator
-from zipfile import ZipFile
-import tempfile
 import os
+from functools import partial
+from image_info_generator import ImageInfoGenerator
 from streamlit_image_select import image_select
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from docx import Document
+from gallery_cache import GalleryCache
+from metrics import get_metrics
+from structured_output import TestCaseStreamParser
+from zip_ingest import build_gallery
+from cpu_pool import get_cpu_pool
+from utils import (format_response_html, job_active, poll_job, render_downloads, render_test_cases,
+                   store_generation_result, submit_job)
+
+
+@st.cache_resource
+def get_gallery_cache():
+    # One cache per server process, shared by every session and rerun
+    return GalleryCache()
+
 
 class MultiImageProcessor:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, image_generator=None):
         self.api_key = api_key or st.session_state.get("api_key")
         if not self.api_key:
             st.error("API key is required for generating responses.")
             return
 
-        self.image_generator = ImageInfoGenerator(api_key=self.api_key)
+        # A shared generator avoids constructing a new client on every rerun
+        self.image_generator = image_generator or ImageInfoGenerator(api_key=self.api_key)
 
     def run(self):
         # Session state for response persistence
@@ -26,40 +35,43 @@ class MultiImageProcessor:
 
         uploaded_file = st.file_uploader("Upload a ZIP file containing images", type=["zip"])
         if uploaded_file:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                with ZipFile(uploaded_file, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
-
-                # Prepare JPEG-converted images
-                jpeg_images = []
-                for root, _, files in os.walk(temp_dir):
-                    for file in files:
-                        if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                            image_path = os.path.join(root, file)
-                            image = Image.open(image_path)
-                            jpeg_image_path = os.path.join(temp_dir, f"{os.path.splitext(file)[0]}.jpg")
-                            rgb_image = image.convert("RGB")
-                            rgb_image.save(jpeg_image_path, format="JPEG")
-                            jpeg_images.append(jpeg_image_path)
-
-                if jpeg_images:
-                    selected_image_path = image_select(
-                        label="Select an image:",
-                        images=jpeg_images,
-                        use_container_width=True
-                    )
-
-                    if selected_image_path:
-                        image = Image.open(selected_image_path)
-                        st.image(image, caption="Selected Image", use_column_width=True)
-
-                        question = st.text_area("Enter your question about the selected image:", height=100)
-                        if st.button("Generate Multi-Image Response"):
-                            description = self.image_generator.generate_image_description(image, question)
-                            st.session_state.response = description or "No response generated. Please check your question and try again."
+            gallery = self.load_gallery(uploaded_file)
+            if gallery is None:
+                pass  # Still being prepared in the background; the progress panel is shown above
+            elif len(gallery):
+                hide_duplicates = st.checkbox("Hide near-duplicate screenshots", value=True)
+                structured = st.checkbox("Structured test cases (table with CSV/JSON/XLSX export)",
+                                         key="structured_output")
+                clusters = gallery.clusters() if hide_duplicates else [[i] for i in range(len(gallery))]
+                shown = [cluster[0] for cluster in clusters]
+                selected_position = image_select(
+                    label="Select an image:",
+                    images=[gallery.thumbnails[i] for i in shown],
+                    captions=[self.cluster_caption(gallery, cluster) for cluster in clusters],
+                    use_container_width=True,
+                    return_value="index"
+                )
 
-                else:
-                    st.warning("The uploaded ZIP file contains no valid image files.")
+                if selected_position is not None:
+                    # Only the picked image is decoded at full resolution
+                    with get_metrics().timer("image_decode"):
+                        image = gallery.load_image(shown[selected_position])
+                    st.image(image, caption="Selected Image", use_column_width=True)
+
+                    question = st.text_area("Enter your question about the selected image:", height=100)
+                    if st.button("Generate Multi-Image Response"):
+                        if structured:
+                            submit_job("image_job", "test case generation", self.test_cases_job,
+                                       self.image_generator.stream_test_cases, image, question)
+                        else:
+                            submit_job("image_job", "image description", self.describe_job, image, question)
+
+                self.run_flow(gallery, structured)
+                self.run_batch(gallery, clusters)
+                # Model calls run in the background so reruns and other users never abort or wait on them
+                poll_job("image_job", self.on_job_done, show_output=True)
+            else:
+                st.warning("The uploaded ZIP file contains no valid image files.")
         else:
             st.info("Please upload a ZIP file containing images to proceed.")
 
@@ -67,9 +79,14 @@ class MultiImageProcessor:
         if st.session_state.response:
             st.markdown("### Generated Response:")
 
-            # Format the response with custom styling, background color, and scroll
-            formatted_response = self.format_response(st.session_state.response)
-            st.markdown(formatted_response, unsafe_allow_html=True)
+            if st.session_state.get("test_cases"):
+                render_test_cases(st.session_state.test_cases)
+            else:
+                # Format the response with custom styling, background color, and scroll
+                formatted_response = self.format_response(st.session_state.response)
+                st.markdown(formatted_response, unsafe_allow_html=True)
+            if st.session_state.get("response_cached"):
+                st.caption("Served from the response cache.")
 
             # Copy to Clipboard Button
             if st.button("Copy to Clipboard"):
@@ -79,75 +96,157 @@ class MultiImageProcessor:
                 )
                 st.success("Response copied to clipboard!")
 
-            # Download buttons for PDF and Word document
-            col1, col2 = st.columns(2)
-            with col1:
-                pdf_data = self.generate_pdf(st.session_state.response)
-                st.download_button(
-                    label="Download as PDF",
-                    data=pdf_data,
-                    file_name="response.pdf",
-                    mime="application/pdf"
-                )
-            with col2:
-                docx_data = self.generate_word_doc(st.session_state.response)
-                st.download_button(
-                    label="Download as Word Document",
-                    data=docx_data,
-                    file_name="response.docx",
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                )
+            # Download buttons for PDF and Word document, built on request
+            render_downloads(st.session_state.response)
+
+    def run_flow(self, gallery, structured=False):
+        """Sends several screens, in the order picked, to the model in a single request."""
+        with st.expander("Describe a flow of screens"):
+            steps = st.multiselect(
+                "Select the screens of the flow, in order:",
+                options=list(range(len(gallery))),
+                format_func=gallery.caption,
+                key="flow_steps"
+            )
+            question = st.text_area("Enter your question about the flow:", height=100, key="flow_question")
+            if st.button("Generate Flow Response") and steps:
+                if structured:
+                    submit_job("image_job", "flow test case generation", self.flow_test_cases_job, gallery, steps,
+                               question)
+                else:
+                    submit_job("image_job", "flow description", self.describe_flow_job, gallery, steps, question)
+
+    def describe_job(self, job, image, question):
+        """Background job: returns ``{"response": description, "cached": cache_hit}``."""
+        job.update(0.0, "Describing the selected image...")
+        try:
+            description, cache_hit = self.image_generator.describe_image(image, question)
+        except Exception as e:
+            description, cache_hit = f"Error generating image description: {e}", False
+        return {"response": description, "cached": cache_hit}
+
+    @staticmethod
+    def decode_flow(job, gallery, steps):
+        images = []
+        for index in steps:
+            job.update(0.5 * len(images) / len(steps), f"Decoding screen {len(images) + 1} of {len(steps)}...")
+            images.append(gallery.decode_image(index))
+        job.update(0.5, f"Analyzing a flow of {len(steps)} screens...")
+        return images
+
+    def describe_flow_job(self, job, gallery, steps, question):
+        """Background job: describes the screens ``steps``, in order, like ``describe_job``."""
+        images = self.decode_flow(job, gallery, steps)
+        try:
+            description, cache_hit = self.image_generator.describe_flow(images, question)
+        except Exception as e:
+            description, cache_hit = f"Error generating flow description: {e}", False
+        return {"response": description, "cached": cache_hit}
+
+    @staticmethod
+    def test_cases_job(job, stream_test_cases, *args):
+        """Background job: collects streamed test cases into ``job.items`` as each one is complete."""
+        job.update(0.5, "Generating test cases...")
+        parser = TestCaseStreamParser()
+        for test_case in stream_test_cases(*args, parser=parser):
+            job.append_item(test_case)
+        return {"test_cases": parser.cases, "errors": parser.errors, "cached": parser.from_cache}
+
+    def flow_test_cases_job(self, job, gallery, steps, question):
+        images = self.decode_flow(job, gallery, steps)
+        return self.test_cases_job(job, self.image_generator.stream_flow_test_cases, images, question)
+
+    @staticmethod
+    def on_job_done(job):
+        return store_generation_result(job.result)
+
+    @staticmethod
+    def cluster_caption(gallery, cluster):
+        caption = gallery.caption(cluster[0])
+        return f"{caption} (+{len(cluster) - 1} similar)" if len(cluster) > 1 else caption
+
+    def run_batch(self, gallery, clusters):
+        """Asks one question per distinct screen (one model call per cluster), rendering answers as they arrive."""
+        with st.expander("Describe all images"):
+            question = st.text_area("Enter a question to ask about every image:", height=100, key="batch_question")
+            max_workers = st.slider("Concurrent requests", min_value=1, max_value=16, value=8)
+            if st.button("Generate Batch Response"):
+                submit_job("image_job", "batch description", self.describe_batch_job, gallery, clusters, question,
+                           max_workers)
+
+    def describe_batch_job(self, job, gallery, clusters, question, max_workers):
+        """Background job: describes one screen per cluster, appending each answer to ``job.output`` as it arrives."""
+        job.update(0.0, "Describing images...")
+        results = {}
+        for position, description in self.image_generator.describe_images(
+                [partial(gallery.decode_image, cluster[0]) for cluster in clusters],
+                question,
+                max_workers=max_workers):
+            results[position] = description
+            job.update(len(results) / len(clusters), f"Described {len(results)} of {len(clusters)} screens")
+            job.append_output(f"**{self.cluster_caption(gallery, clusters[position])}**\n\n{description}\n\n")
+
+        response = "\n\n".join(
+            self.cluster_heading(gallery, clusters[position]) + f"\n{results[position]}"
+            for position in sorted(results)
+        )
+        return {"response": response, "cached": False}
+
+    @staticmethod
+    def cluster_heading(gallery, cluster):
+        heading = f"**{gallery.caption(cluster[0])}**"
+        if len(cluster) > 1:
+            heading += " (also applies to: " + ", ".join(gallery.caption(i) for i in cluster[1:]) + ")"
+        return heading
+
+    def load_gallery(self, uploaded_file):
+        """
+        Returns the cached gallery for the upload, or None while it is being prepared in the background.
 
-    def format_response(self, text):
-        # Custom styling with background color, padding, and scrollable div
-        formatted_text = ""
-        lines = text.splitlines()
-        for line in lines:
-            if line.startswith("1. ") or line.startswith("2. "):
-                formatted_text += f"<li>{line[3:]}</li>"
-            elif "**" in line:
-                formatted_text += f"<p><b>{line}</b></p>"
-            else:
-                formatted_text += f"<p>{line}</p>"
-
-        return f"""
-            <div style="
-                background-color: #f0f4f8;
-                padding: 20px;
-                border-radius: 8px;
-                border: 1px solid #ddd;
-                font-family: Arial, sans-serif;
-                color: #333;
-                max-height: 300px;
-                overflow-y: scroll;
-            ">
-                {formatted_text}
-            </div>
+        The archive is hashed only once per upload. A cache miss (including a gallery evicted since
+        it was built) starts an ingest job; after a failed or cancelled one, the user can retry.
         """
+        file_id = getattr(uploaded_file, "file_id", None) or uploaded_file.name
+        upload_key = st.session_state.get("gallery_upload")
+        if upload_key and upload_key[0] == file_id:
+            content_hash = upload_key[1]
+        else:
+            content_hash = GalleryCache.hash_upload(uploaded_file)
+            st.session_state.gallery_upload = (file_id, content_hash)
+
+        gallery_cache = get_gallery_cache()
+        gallery = gallery_cache.get(content_hash)
+        if gallery is None:
+            # gallery_job_hash stays set only while a job runs for this upload or after one ended without a result
+            job_hash = st.session_state.get("gallery_job_hash")
+            if job_hash != content_hash or (not job_active("gallery_job")
+                                            and st.button("Retry preparing the gallery")):
+                st.session_state.gallery_job_hash = content_hash
+                # The job gets its own spooled copy on disk; Streamlit may replace the file object on rerun
+                submit_job("gallery_job", "ZIP ingest", self.ingest_job, gallery_cache, content_hash,
+                           gallery_cache.spool_upload(uploaded_file))
+        get_metrics().cache_lookup("gallery", gallery is not None)
+        poll_job("gallery_job", self.on_gallery_ready)
+        return gallery
+
+    @staticmethod
+    def on_gallery_ready(job):
+        # Lets the upload be ingested again automatically should the cache evict its gallery
+        st.session_state.pop("gallery_job_hash", None)
+
+    @staticmethod
+    def ingest_job(job, gallery_cache, content_hash, upload_path):
+        """Background job: builds thumbnails and hashes for the spooled archive into the gallery cache."""
+        job.update(0.0, "Preparing thumbnails...")
+        try:
+            with get_metrics().timer("zip_ingest", bytes=os.path.getsize(upload_path)):
+                gallery_cache.get_or_build(content_hash, lambda directory: build_gallery(
+                    upload_path, directory, progress=job.update, executor=get_cpu_pool()))
+        finally:
+            # Left over when the gallery was already cached or the build failed
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
 
-    def generate_pdf(self, text):
-        pdf_buffer = BytesIO()
-        pdf = canvas.Canvas(pdf_buffer, pagesize=letter)
-        pdf.setFont("Helvetica", 12)
-
-        width, height = letter
-        text_lines = text.splitlines()
-        y_position = height - 40
-        for line in text_lines:
-            if y_position <= 40:
-                pdf.showPage()
-                y_position = height - 40
-            pdf.drawString(40, y_position, line)
-            y_position -= 14
-
-        pdf.save()
-        pdf_buffer.seek(0)
-        return pdf_buffer
-
-    def generate_word_doc(self, text):
-        doc_buffer = BytesIO()
-        doc = Document()
-        doc.add_paragraph(text)
-        doc.save(doc_buffer)
-        doc_buffer.seek(0)
-        return doc_buffer
+    def format_response(self, text):
+        # Custom styling with background color, padding, and scrollable div
+        return format_response_html(text)
@@ -0,0 +1,139 @@
+# response_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+PRUNE_INTERVAL_SECONDS = 60 * 60
+DEFAULT_SQLITE_PATH = os.environ.get(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "ai_testcase_generator", "responses.sqlite3")
+)
+
+
+def text_hash(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def make_cache_key(model, temperature, prompt_template, question, context_hash=None, image_hash=None):
+    """Builds a response cache key from everything that influences the model's answer."""
+    payload = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "prompt_template": text_hash(prompt_template),
+            "question": question,
+            "context": context_hash,
+            "image": image_hash,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Interface for LLM response caches; the base class caches nothing."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+
+class MemoryResponseCache(ResponseCache):
+    """In-process LRU cache with a TTL."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """On-disk cache shared by every process on the host, with a TTL; expired rows are pruned on write."""
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 prune_interval_seconds=PRUNE_INTERVAL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.prune_interval_seconds = prune_interval_seconds
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return row[0]
+
+    def set(self, key, value):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, stored_at) VALUES (?, ?, ?)", (key, value, time.time())
+            )
+        now = time.time()
+        if now - self._last_prune >= self.prune_interval_seconds:
+            self._last_prune = now
+            self.prune()
+
+    def prune(self):
+        """Deletes expired entries."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl_seconds,))
+
+
+@lru_cache(maxsize=None)
+def get_response_cache(backend=None):
+    """
+    Process-wide response cache.
+
+    Args:
+        backend (str): "memory", "sqlite" or "none"; defaults to the RESPONSE_CACHE_BACKEND
+            environment variable, falling back to "memory".
+
+    Returns:
+        ResponseCache: The shared cache for that backend.
+    """
+    backend = (backend or os.environ.get("RESPONSE_CACHE_BACKEND", "memory")).lower()
+    if backend == "sqlite":
+        return SQLiteResponseCache()
+    if backend == "none":
+        return ResponseCache()
+    if backend == "memory":
+        return MemoryResponseCache()
+    raise ValueError(f"Unknown response cache backend: {backend}")
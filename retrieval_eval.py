@@ -0,0 +1,104 @@
+# retrieval_eval.py
+"""
+Offline evaluation of web QA retrieval modes on a small labelled set (retrieval_eval_set.json).
+
+Runs without network access: vectors come from a deterministic hashing embedding, so the
+numbers compare retrieval strategies rather than embedding models. Usage:
+
+    python retrieval_eval.py [--k 4]
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+from hybrid_retriever import BM25Index, HybridRetriever, TermOverlapReranker
+
+EVAL_SET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_eval_set.json")
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-character-trigrams embeddings for offline runs."""
+
+    def __init__(self, dimensions=256):
+        self.dimensions = dimensions
+
+    def _embed(self, text):
+        vector = [0.0] * self.dimensions
+        normalized = f"  {text.lower()}  "
+        for i in range(len(normalized) - 2):
+            bucket = int(hashlib.md5(normalized[i:i + 3].encode("utf-8")).hexdigest()[:8], 16) % self.dimensions
+            vector[bucket] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def load_eval_set(path=EVAL_SET_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    documents = [
+        Document(page_content=passage["text"], metadata={"id": passage["id"], "source": passage["source"]})
+        for passage in data["passages"]
+    ]
+    return documents, data["queries"]
+
+
+def evaluate(retrieve, queries, k):
+    """
+    Returns recall@k, MRR and mean context sizes (in words) for ``retrieve``.
+
+    ``context_words`` counts all k chunks; ``words_to_hit`` counts the chunks up to and including
+    the first relevant one, i.e. how much context must be read before the answer appears.
+    """
+    recall = reciprocal_rank = words = words_to_hit = 0.0
+    for item in queries:
+        hits = retrieve(item["query"])[:k]
+        ids = [doc.metadata["id"] for doc in hits]
+        relevant = set(item["relevant"])
+        recall += len(relevant.intersection(ids)) / len(relevant)
+        reciprocal_rank += next((1.0 / (rank + 1) for rank, doc_id in enumerate(ids) if doc_id in relevant), 0.0)
+        sizes = [len(doc.page_content.split()) for doc in hits]
+        words += sum(sizes)
+        first_hit = next((rank for rank, doc_id in enumerate(ids) if doc_id in relevant), len(ids) - 1)
+        words_to_hit += sum(sizes[:first_hit + 1])
+    count = len(queries)
+    return {"recall": recall / count, "mrr": reciprocal_rank / count, "context_words": words / count,
+            "words_to_hit": words_to_hit / count}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--k", type=int, default=4, help="Chunks passed to the prompt")
+    args = parser.parse_args(argv)
+
+    documents, queries = load_eval_set()
+    vector_store = FAISS.from_documents(documents, HashingEmbeddings())
+    bm25_index = BM25Index(documents)
+    modes = {
+        "vector": lambda q: vector_store.similarity_search(q, k=args.k),
+        "bm25": lambda q: [doc for doc, _ in bm25_index.search(q, k=args.k)],
+        "hybrid": HybridRetriever(vector_store, k=args.k, bm25_index=bm25_index).invoke,
+        "hybrid+rerank": HybridRetriever(vector_store, k=args.k, bm25_index=bm25_index,
+                                         reranker=TermOverlapReranker()).invoke,
+    }
+
+    print(f"{'mode':<15}{'recall@' + str(args.k):>10}{'MRR':>8}{'words/query':>13}{'words to hit':>14}")
+    for name, retrieve in modes.items():
+        scores = evaluate(retrieve, queries, args.k)
+        print(f"{name:<15}{scores['recall']:>10.3f}{scores['mrr']:>8.3f}{scores['context_words']:>13.1f}"
+              f"{scores['words_to_hit']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
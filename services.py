@@ -0,0 +1,34 @@
+# services.py
+import httpx
+from cpu_pool import get_cpu_pool
+from image_info_generator import ImageInfoGenerator
+from web_test_case_generator import WebTestCaseGenerator
+
+
+def create_http_client(max_connections=64, max_keepalive_connections=32, timeout=60.0):
+    """Keep-alive connection pool shared by every model and embeddings client of one API key."""
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+        timeout=httpx.Timeout(timeout, connect=10.0),
+    )
+
+
+class Services:
+    """
+    Session-independent generators for one API key.
+
+    Build one instance per key and share it between sessions and threads: the generators
+    hold no per-user state (vector stores are passed in by the caller), and all their
+    OpenAI traffic goes through a single pooled HTTP client.
+    """
+
+    def __init__(self, api_key, base_url=None, model_name="gpt-4o-mini"):
+        self.http_client = create_http_client()
+        self.image_generator = ImageInfoGenerator(model_name=model_name, api_key=api_key, base_url=base_url,
+                                                  http_client=self.http_client)
+        self.web_generator = WebTestCaseGenerator(api_key=api_key, model_name=model_name, base_url=base_url,
+                                                  http_client=self.http_client, cpu_pool=get_cpu_pool())
+
+    def close(self):
+        self.http_client.close()
+        self.web_generator.fetcher.session.close()
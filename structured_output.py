@@ -0,0 +1,157 @@
+# structured_output.py
+"""Structured test-case output: the schema, prompt instructions and an incremental stream parser."""
+import json
+
+TEST_CASE_FIELDS = ("id", "title", "type", "priority", "preconditions", "steps", "expected_result")
+PRIORITIES = ("High", "Medium", "Low")
+
+# JSON Schema of one test case, kept in step with validate_test_case
+TEST_CASE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "string"},
+        "title": {"type": "string"},
+        "type": {"type": "string"},
+        "priority": {"type": "string", "enum": list(PRIORITIES)},
+        "preconditions": {"type": "string"},
+        "steps": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+        "expected_result": {"type": "string"},
+    },
+    "required": ["title", "steps", "expected_result"],
+}
+
+STRUCTURED_OUTPUT_INSTRUCTIONS = (
+    "Return the test cases as JSON Lines: exactly one JSON object per line, with no surrounding array, "
+    "markdown or commentary. Each object must match this JSON Schema: " + json.dumps(TEST_CASE_SCHEMA) +
+    ' Use ids like "TC-001" and a type such as "Functional", "Negative", "Boundary" or "Usability".'
+)
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return "\n".join(_text(item) for item in value)
+    return str(value).strip()
+
+
+def validate_test_case(data, number):
+    """
+    Checks one parsed object against the schema and returns it normalized to TEST_CASE_FIELDS.
+
+    Args:
+        data: The decoded JSON value.
+        number (int): Position of the case in the response, used for a missing id.
+
+    Raises:
+        ValueError: If a required field is missing or has the wrong shape.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"Test case {number} is not a JSON object")
+    title = _text(data.get("title"))
+    steps = data.get("steps")
+    if isinstance(steps, str):
+        steps = [line for line in steps.splitlines() if line.strip()]
+    if not title or not isinstance(steps, list) or not steps:
+        raise ValueError(f"Test case {number} needs a title and at least one step")
+    expected_result = _text(data.get("expected_result", data.get("expected")))
+    if not expected_result:
+        raise ValueError(f"Test case {number} needs an expected_result")
+    priority = _text(data.get("priority")).capitalize() or "Medium"
+    if priority not in PRIORITIES:
+        raise ValueError(f"Test case {number} has an unknown priority: {priority}")
+    return {
+        "id": _text(data.get("id")) or f"TC-{number:03d}",
+        "title": title,
+        "type": _text(data.get("type")) or "Functional",
+        "priority": priority,
+        "preconditions": _text(data.get("preconditions")),
+        "steps": [_text(step) for step in steps],
+        "expected_result": expected_result,
+    }
+
+
+class TestCaseStreamParser:
+    """
+    Extracts test cases from streamed model output as soon as each JSON object is complete.
+
+    Tolerates JSON Lines, a JSON array, a ``{"test_cases": [...]}`` wrapper and markdown code
+    fences; text between objects is ignored. Objects that fail validation are recorded in
+    ``errors`` instead of interrupting the stream.
+    """
+
+    def __init__(self):
+        self.cases = []
+        self.errors = []
+        self.from_cache = False  # Set by the generator when the output was a response cache hit
+        self._objects = 0
+        self._current = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        """Consumes the next piece of output; returns the test cases completed by it."""
+        completed = []
+        for char in text:
+            if self._depth == 0:
+                if char == "{":
+                    self._depth, self._current = 1, ["{"]
+                continue
+            self._current.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.extend(self._complete("".join(self._current)))
+        return completed
+
+    def _complete(self, raw):
+        try:
+            data = json.loads(raw)
+        except ValueError as e:
+            self.errors.append(f"Unparseable test case: {e}")
+            return []
+        items = data["test_cases"] if isinstance(data, dict) and isinstance(data.get("test_cases"), list) else [data]
+        completed = []
+        for item in items:
+            self._objects += 1
+            try:
+                case = validate_test_case(item, self._objects)
+            except ValueError as e:
+                self.errors.append(str(e))
+                continue
+            self.cases.append(case)
+            completed.append(case)
+        return completed
+
+
+def to_rows(test_cases):
+    """Flat rows for tables and CSV/XLSX export, with the steps numbered on separate lines."""
+    return [
+        dict(case, steps="\n".join(f"{number}. {step}" for number, step in enumerate(case["steps"], start=1)))
+        for case in test_cases
+    ]
+
+
+def to_markdown(test_cases):
+    """Plain-text rendering used for the response text and the PDF/Word exports."""
+    sections = []
+    for case in test_cases:
+        lines = [f"**{case['id']}: {case['title']}** ({case['type']}, {case['priority']} priority)"]
+        if case["preconditions"]:
+            lines.append(f"Preconditions: {case['preconditions']}")
+        lines.extend(f"{number}. {step}" for number, step in enumerate(case["steps"], start=1))
+        lines.append(f"Expected result: {case['expected_result']}")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
@@ -0,0 +1,62 @@
+# test_web_fetcher.py
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from web_fetcher import WebFetcher
+
+PAGE = "<html><head><title>Zahlungen</title></head><body><p>Überweisung – Betrag prüfen</p></body></html>"
+
+
+@pytest.fixture
+def site():
+    """Local stand-in server: UTF-8 pages and a sitemap, all served without a charset."""
+    pages = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in pages:
+                self.send_error(404)
+                return
+            content_type, body = pages[self.path]
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    pages["/payments"] = ("text/html", PAGE.encode("utf-8"))
+    pages["/latin"] = ("text/html; charset=ISO-8859-1", PAGE.replace("–", "-").encode("latin-1"))
+    pages["/sitemap.xml"] = ("application/xml", (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        f"<url><loc>{base_url}/payments</loc></url><url><loc>{base_url}/latin</loc></url>"
+        "</urlset>"
+    ).encode("utf-8"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield base_url
+    server.shutdown()
+    server.server_close()
+
+
+def test_expand_sitemap_without_charset(site):
+    fetcher = WebFetcher(per_host_interval=0)
+    assert fetcher.expand_sitemap(f"{site}/sitemap.xml") == [f"{site}/payments", f"{site}/latin"]
+
+
+def test_fetch_detects_utf8_without_charset(site):
+    result = WebFetcher(per_host_interval=0).fetch(f"{site}/payments")
+    assert result.ok
+    assert "Überweisung – Betrag prüfen" in result.content
+
+
+def test_fetch_honours_declared_charset(site):
+    result = WebFetcher(per_host_interval=0).fetch(f"{site}/latin")
+    assert result.ok
+    assert "Überweisung - Betrag prüfen" in result.content
@@ -1,7 +1,230 @@
 import streamlit as st
+import json
+from functools import lru_cache
+import exporters
+from cpu_pool import get_cpu_pool
+from jobs import CANCELLED, get_job_manager
+from metrics import get_metrics
+from structured_output import to_markdown, to_rows
+
+JOB_STATE_KEYS = ("gallery_job", "image_job", "web_data_job", "web_answer_job", "export_job")
+
+
+def cancel_jobs(*state_keys):
+    """Cancels the background jobs whose ids are stored under ``state_keys`` and forgets them."""
+    for key in state_keys:
+        job_id = st.session_state.pop(key, None)
+        if job_id:
+            get_job_manager().cancel(job_id)
+
 
 def reset_session_state():
+    # Background work started for the previous data source is no longer wanted
+    cancel_jobs(*JOB_STATE_KEYS)
     st.session_state.pop("response", None)
     st.session_state.pop("image_description", None)
+    st.session_state.pop("response_cached", None)
+    st.session_state.pop("test_cases", None)
     st.session_state.pop("vector_store", None)
     st.session_state.pop("web_data_loaded", None)  # Reset web data load state
+    st.session_state.pop("export_ready", None)
+    st.session_state.pop("gallery_job_hash", None)
+
+
+def submit_job(state_key, kind, work, *args):
+    """Runs ``work(job, *args)`` in the background, replacing (and cancelling) the job held in ``state_key``."""
+    manager = get_job_manager()
+    previous = st.session_state.get(state_key)
+    if previous:
+        manager.cancel(previous)
+    st.session_state[state_key] = manager.submit(kind, work, *args).id
+
+
+def job_active(state_key):
+    """True while the job whose id is stored in ``st.session_state[state_key]`` is queued or running."""
+    job_id = st.session_state.get(state_key)
+    job = get_job_manager().get(job_id) if job_id else None
+    return job is not None and job.active
+
+
+def poll_job(state_key, on_done, show_output=False):
+    """
+    Shows progress for the background job whose id is stored in ``st.session_state[state_key]``.
+
+    The panel refreshes itself every second without rerunning the page, and offers a Cancel
+    button. Once the job succeeds, ``on_done(job)`` is called and the page is rerun; it may
+    return a ``(level, text)`` notice such as ``("success", "Loaded")``. Notices, failures and
+    cancellations are shown where the panel was.
+
+    Returns:
+        bool: True while the job is still queued or running.
+    """
+    notice = st.session_state.pop(f"{state_key}_notice", None)
+    if notice:
+        getattr(st, notice[0])(notice[1])
+    job_id = st.session_state.get(state_key)
+    if not job_id:
+        return False
+
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+    @fragment(run_every=1.0)
+    def job_panel():
+        job = manager.get(job_id)
+        if job is not None and job.active:
+            st.progress(job.progress, text=job.message or f"Waiting for {job.kind} to finish...")
+            if show_output and job.items:
+                st.dataframe(to_rows(job.items), hide_index=True, use_container_width=True)
+            elif show_output and job.output:
+                st.markdown(job.output)
+            if st.button("Cancel", key=f"cancel_{job_id}"):
+                manager.cancel(job_id)
+            return
+
+        st.session_state.pop(state_key, None)
+        if job is None:
+            st.session_state[f"{state_key}_notice"] = ("warning", "The background job expired before it was collected.")
+        elif job.status == CANCELLED:
+            st.session_state[f"{state_key}_notice"] = ("info", f"Cancelled {job.kind}.")
+        elif job.error is not None:
+            st.session_state[f"{state_key}_notice"] = ("error", f"{job.kind.capitalize()} failed: {job.error}")
+        else:
+            st.session_state[f"{state_key}_notice"] = on_done(job)
+        st.rerun()
+
+    job_panel()
+    return job is not None and job.active
+
+
+def build_exports(job, text, related_chunks):
+    # Fills the process-wide export cache, so the download buttons are then served instantly
+    for position, export_format in enumerate(("pdf", "docx")):
+        job.update(position / 2, f"Building the {export_format.upper()} file...")
+        # Layout is pure Python; a worker process keeps it from stalling other sessions' threads
+        exporters.export(export_format, text, related_chunks, executor=get_cpu_pool())
+    return exporters.content_hash(text, related_chunks)
+
+
+def render_downloads(text, related_chunks=None):
+    """Shows PDF/Word download buttons, building the files in the background once the user asks for them."""
+    export_key = exporters.content_hash(text, related_chunks)
+    if st.session_state.get("export_ready") != export_key:
+        if st.button("Prepare Downloads"):
+            submit_job("export_job", "export", build_exports, text, related_chunks)
+        poll_job("export_job", lambda job: st.session_state.update(export_ready=job.result))
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="Download as PDF",
+            data=exporters.export("pdf", text, related_chunks),
+            file_name="response.pdf",
+            mime=exporters.PDF_MIME_TYPE
+        )
+    with col2:
+        st.download_button(
+            label="Download as Word Document",
+            data=exporters.export("docx", text, related_chunks),
+            file_name="response.docx",
+            mime=exporters.DOCX_MIME_TYPE
+        )
+
+
+def render_metrics_panel():
+    """Sidebar debug panel: per-stage timings, bytes, token counts and cache hit rates for this server process."""
+    metrics = get_metrics()
+    snapshot = metrics.snapshot()
+    with st.sidebar.expander("Performance metrics", expanded=True):
+        st.caption("Totals for every session served by this process since start-up or the last reset.")
+        if not snapshot["stages"] and not snapshot["caches"]:
+            st.write("Nothing recorded yet.")
+            return
+
+        st.dataframe([
+            {
+                "Stage": stage,
+                "Runs": stats["count"],
+                "Avg ms": round(stats["avg_seconds"] * 1000, 1),
+                "Max ms": round(stats["max_seconds"] * 1000, 1),
+                "Total s": round(stats["seconds"], 2),
+                "KB": round(stats["bytes"] / 1024, 1),
+                "Tokens": stats["tokens"],
+                "Errors": stats["errors"],
+            }
+            for stage, stats in sorted(snapshot["stages"].items())
+        ], hide_index=True)
+        if snapshot["caches"]:
+            st.dataframe([
+                {"Cache": cache, "Hits": counts["hits"], "Misses": counts["misses"],
+                 "Hit rate": f"{counts['hit_rate']:.0%}"}
+                for cache, counts in sorted(snapshot["caches"].items())
+            ], hide_index=True)
+
+        st.download_button(
+            label="Download metrics (JSON)",
+            data=json.dumps(snapshot, indent=2),
+            file_name="metrics.json",
+            mime="application/json"
+        )
+        if st.button("Reset metrics"):
+            metrics.reset()
+
+
+@lru_cache(maxsize=32)
+def format_response_html(text):
+    """Renders a free-text response as a styled, scrollable HTML block (memoized across reruns)."""
+    parts = []
+    for line in text.splitlines():
+        if line.startswith("1. ") or line.startswith("2. "):
+            parts.append(f"<li>{line[3:]}</li>")
+        elif "**" in line:
+            parts.append(f"<p><b>{line}</b></p>")
+        else:
+            parts.append(f"<p>{line}</p>")
+
+    return f"""
+        <div style="background-color: #f0f4f8; padding: 20px; border-radius: 8px; border: 1px solid #ddd;
+                    font-family: Arial, sans-serif; color: #333; max-height: 300px; overflow-y: scroll;">
+            {"".join(parts)}
+        </div>
+    """
+
+
+def render_test_cases(test_cases):
+    """Shows structured test cases as a table with CSV/JSON/XLSX downloads for test-management import."""
+    st.dataframe(to_rows(test_cases), hide_index=True, use_container_width=True)
+    for column, export_format in zip(st.columns(3), ("csv", "json", "xlsx")):
+        with column:
+            st.download_button(
+                label=f"Download as {export_format.upper()}",
+                data=exporters.export_test_cases(export_format, test_cases),
+                file_name=f"test_cases.{export_format}",
+                mime=exporters.TEST_CASE_MIME_TYPES[export_format],
+                key=f"test_cases_{export_format}"
+            )
+
+
+def malformed_cases_notice(errors):
+    """Warning shown after a structured response that contained malformed test cases, or None."""
+    if not errors:
+        return None
+    return "warning", f"Skipped {len(errors)} malformed test case(s), e.g. {errors[0]}"
+
+
+def store_generation_result(result):
+    """
+    Stores a finished answer or test-case job result (``response`` or ``test_cases``, ``errors``, ``cached``).
+
+    Returns:
+        tuple: The ``poll_job`` notice about malformed test cases, or None.
+    """
+    test_cases = result.get("test_cases")
+    # Structured results are kept as data; the text form only feeds the PDF/Word exports
+    st.session_state["test_cases"] = test_cases
+    response = to_markdown(test_cases) if test_cases is not None else result["response"]
+    st.session_state["response"] = response or "No response generated. Please check your question and try again."
+    st.session_state["response_cached"] = result["cached"]
+    return malformed_cases_notice(result.get("errors"))
@@ -0,0 +1,275 @@
+# web_fetcher.py
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import requests
+from bs4 import BeautifulSoup, UnicodeDammit
+from langchain.schema import Document
+from requests.adapters import HTTPAdapter
+
+from metrics import get_metrics
+
+DEFAULT_USER_AGENT = "AITestCaseGenerator/1.0 (+crawler)"
+SITEMAP_NAMESPACE = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+BOILERPLATE_TAGS = ["nav", "aside"]
+PAGE_CHROME_TAGS = ["header", "footer"]  # Only boilerplate outside <main>/<article>, where they hold titles
+BOILERPLATE_ROLES = ["navigation", "banner", "contentinfo"]
+# Matched against whole class/id tokens, so e.g. "error-banner" or "subscribe-form-error" are kept
+BOILERPLATE_PATTERN = re.compile(
+    r"(cookie|consent|gdpr)([-_](banner|notice|bar|popup|consent))?|newsletter([-_](signup|form))?|breadcrumbs?"
+    r"|skip[-_]link|site[-_](nav|header|footer)|navbar|social[-_]share",
+    re.IGNORECASE
+)
+CHARSET_PATTERN = re.compile(r"""charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+
+
+def decode_body(body, content_type=None):
+    """
+    Decodes a response body, using the charset from the Content-Type header only when one is given.
+
+    Without one, the encoding is detected from the bytes (BOM, <meta charset> or XML declaration,
+    then content sniffing) rather than assuming requests' ISO-8859-1 default for text/*.
+    """
+    match = CHARSET_PATTERN.search(content_type or "")
+    if match:
+        try:
+            return body.decode(match.group(1), errors="replace")
+        except LookupError:
+            pass  # Unknown charset name; detect instead
+    detected = UnicodeDammit(body, is_html=True).unicode_markup
+    return detected if detected is not None else body.decode("utf-8", errors="replace")
+
+
+class FetchResult:
+    """Outcome of fetching one URL."""
+
+    def __init__(self, url, status, content=None, etag=None, last_modified=None, error=None, body=None):
+        self.url = url
+        self.status = status
+        self.content = content
+        self.body = body  # Raw bytes, for parsers that honour the document's own encoding (e.g. XML)
+        self.etag = etag
+        self.last_modified = last_modified
+        self.error = error
+
+    @property
+    def not_modified(self):
+        return self.status == 304
+
+    @property
+    def ok(self):
+        return self.error is None and self.content is not None
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host by at least ``min_interval`` seconds."""
+
+    def __init__(self, min_interval=0.2):
+        self.min_interval = min_interval
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        if self.min_interval <= 0:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class WebFetcher:
+    """
+    Concurrent, polite page fetcher over a pooled keep-alive HTTP session.
+
+    Responses are capped at ``max_bytes``; validators (ETag / Last-Modified) from earlier
+    fetches are sent back so unchanged pages come back as cheap 304s.
+    """
+
+    def __init__(self, max_workers=8, per_host_interval=0.2, max_bytes=5 * 1024 * 1024, timeout=20,
+                 user_agent=DEFAULT_USER_AGENT, session=None, metrics=None):
+        self.max_workers = max_workers
+        self.metrics = metrics or get_metrics()
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.rate_limiter = HostRateLimiter(per_host_interval)
+        self.session = session or self.create_session(max_workers, user_agent)
+        self._validators = {}  # url -> (etag, last_modified)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def create_session(pool_size, user_agent=DEFAULT_USER_AGENT):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["User-Agent"] = user_agent
+        return session
+
+    def remember(self, url, etag=None, last_modified=None):
+        """Seeds the validators sent with the next conditional GET of ``url``."""
+        with self._lock:
+            self._validators[url] = (etag, last_modified)
+
+    def fetch(self, url, conditional=True):
+        """Fetches a single URL, honouring the per-host rate limit and the size cap."""
+        with self.metrics.timer("page_fetch") as stage:
+            result = self.download(url, conditional, stage)
+            stage["error"] = not (result.ok or result.not_modified)
+        if stage.get("conditional"):
+            self.metrics.cache_lookup("http_conditional", result.not_modified)
+        return result
+
+    def download(self, url, conditional, stage):
+        """Performs the GET behind ``fetch``, noting the body size in the ``stage`` timing dict."""
+        headers = {}
+        if conditional:
+            with self._lock:
+                etag, last_modified = self._validators.get(url, (None, None))
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+            stage["conditional"] = bool(headers)
+
+        self.rate_limiter.wait(url)
+        try:
+            with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                if response.status_code == 304:
+                    return FetchResult(url, 304)
+                response.raise_for_status()
+
+                declared_length = response.headers.get("Content-Length")
+                if declared_length and declared_length.isdigit() and int(declared_length) > self.max_bytes:
+                    return FetchResult(url, response.status_code, error=f"Response exceeds {self.max_bytes} bytes")
+
+                body = bytearray()
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    body.extend(chunk)
+                    if len(body) > self.max_bytes:
+                        return FetchResult(url, response.status_code, error=f"Response exceeds {self.max_bytes} bytes")
+                stage["bytes"] = len(body)
+
+                body = bytes(body)
+                content = decode_body(body, response.headers.get("Content-Type"))
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                with self._lock:
+                    self._validators[url] = (etag, last_modified)
+                return FetchResult(url, response.status_code, content, etag, last_modified, body=body)
+        except requests.RequestException as e:
+            return FetchResult(url, getattr(e.response, "status_code", None), error=str(e))
+
+    def fetch_all(self, urls, conditional=True):
+        """Fetches ``urls`` concurrently, yielding FetchResults in completion order."""
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = [executor.submit(self.fetch, url, conditional) for url in dict.fromkeys(urls)]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def expand_sitemap(self, sitemap_url, max_urls=500):
+        """Returns the page URLs listed in a sitemap, following nested sitemap indexes."""
+        urls = []
+        pending = [sitemap_url]
+        seen = set()
+        while pending and len(urls) < max_urls:
+            current = pending.pop(0)
+            if current in seen:
+                continue
+            seen.add(current)
+            result = self.fetch(current, conditional=False)
+            if not result.ok:
+                continue
+            try:
+                root = ET.fromstring(result.body)
+            except ET.ParseError:
+                continue
+            for loc in root.iter(f"{SITEMAP_NAMESPACE}loc"):
+                location = (loc.text or "").strip()
+                if not location:
+                    continue
+                if root.tag == f"{SITEMAP_NAMESPACE}sitemapindex":
+                    pending.append(location)
+                else:
+                    urls.append(location)
+        return urls[:max_urls]
+
+
+def strip_boilerplate(soup):
+    """
+    Removes navigation, site headers/footers, cookie/consent banners and similar chrome from a parsed page.
+
+    Dialogs, alerts and headers inside the main content are kept: they carry the titles, modals
+    and error messages that test cases are written about.
+    """
+    for element in soup(BOILERPLATE_TAGS):
+        element.decompose()
+    for element in soup(PAGE_CHROME_TAGS):
+        if not element.decomposed and element.find_parent(["main", "article"]) is None:
+            element.decompose()
+    for element in soup.find_all(attrs={"role": BOILERPLATE_ROLES}):
+        if not element.decomposed:
+            element.decompose()
+    for element in soup.find_all(True):
+        if element.decomposed:
+            continue  # Already removed along with a boilerplate ancestor
+        tokens = [element.get("id") or ""] + list(element.get("class") or [])
+        if any(BOILERPLATE_PATTERN.fullmatch(token) for token in tokens if token):
+            element.decompose()
+
+
+def parse_html(url, html, remove_boilerplate=True):
+    """Extracts the visible text and title of an HTML page into a Document, like WebBaseLoader."""
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup(["script", "style", "noscript"]):
+        element.decompose()
+    title = soup.title.get_text(strip=True) if soup.title else url
+    metadata = {"source": url, "title": title}
+    description = soup.find("meta", attrs={"name": "description"})
+    if description and description.get("content"):
+        metadata["description"] = description["content"]
+    if remove_boilerplate:
+        strip_boilerplate(soup)
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+def normalize_whitespace(text):
+    """Collapses runs of whitespace but keeps paragraph breaks for the text splitter."""
+    paragraphs = (' '.join(part.split()) for part in re.split(r'\n\s*\n', text))
+    return '\n\n'.join(paragraph for paragraph in paragraphs if paragraph)
+
+
+def parse_page(url, html, remove_boilerplate=True):
+    """Parses one page into a Document with normalized text, or None if it has no text."""
+    document = parse_html(url, html, remove_boilerplate)
+    document.page_content = normalize_whitespace(document.page_content)
+    return document if document.page_content else None
+
+
+def parse_pages(pages, remove_boilerplate=True):
+    """
+    Parses a batch of ``(url, html)`` pairs; module-level so it can run on a worker process.
+
+    Returns:
+        list: ``(document_or_None, seconds)`` per page, timed in the worker.
+    """
+    parsed = []
+    for url, html in pages:
+        started = time.perf_counter()
+        document = parse_page(url, html, remove_boilerplate)
+        parsed.append((document, time.perf_counter() - started))
+    return parsed
+
+
+def is_sitemap_url(url):
+    return urlparse(url).path.lower().endswith(".xml")
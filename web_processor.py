@@ -1,23 +1,28 @@
 import streamlit as st
 from web_test_case_generator import WebTestCaseGenerator
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from io import BytesIO
-from docx import Document
+from structured_output import TestCaseStreamParser
+from utils import (cancel_jobs, format_response_html, poll_job, render_downloads, render_test_cases,
+                   store_generation_result, submit_job)
+
+LOAD_ERROR = "Error: Failed to load documents from the specified URL."
 
 
 class WebProcessor:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, web_generator=None):
         self.api_key = api_key or st.session_state.get("api_key")
         if not self.api_key:
             st.error("API key is required for generating responses.")
             return
-        self.web_generator = WebTestCaseGenerator(api_key=self.api_key)
+        # A shared generator avoids constructing new clients on every rerun
+        self.web_generator = web_generator or WebTestCaseGenerator(api_key=self.api_key)
 
     def reset_session_state(self):
         """Clear session state data for a new URL input, except for API key."""
+        # An answer or export still running for the previous pages must not land on the new ones
+        cancel_jobs("web_answer_job", "export_job")
+        st.session_state.pop("export_ready", None)
         for key in ["vector_store", "response", "related_chunks", "web_data_loaded", "response_displayed",
-                    "related_displayed"]:
+                    "related_displayed", "response_cached", "test_cases"]:
             st.session_state[key] = "" if key == "response" else False if key.endswith("displayed") else None
 
     def run(self):
@@ -30,34 +35,45 @@ class WebProcessor:
         st.session_state.setdefault("related_displayed", False)
 
         # Web Data Input
-        url = st.text_input("Enter the website URL:")
+        url = st.text_area("Enter the website URL (or several URLs, one per line, or a sitemap.xml URL):", height=68)
 
         # Reset session state when a new URL is entered
         if url and st.button("Load Web Data"):
             self.reset_session_state()  # Clear previous data before loading new data
-            message = self.web_generator.prepare_web_data(url)
-            if st.session_state.get("web_data_loaded"):
-                st.success("Web data loaded successfully!")
-            else:
-                st.error(message)
+            self.prepare_web_data(url)
+
+        # Re-embed only what changed since the index was saved
+        if url and st.button("Refresh Web Data"):
+            self.reset_session_state()
+            self.refresh_web_data(url)
+
+        # Crawling and indexing run in the background; the page only polls for progress
+        poll_job("web_data_job", self.on_web_data_ready)
 
         # Question input and response generation
         if st.session_state.get("web_data_loaded"):
             question = st.text_area("Enter your question:", height=100)
+            structured = st.checkbox("Structured test cases (table with CSV/JSON/XLSX export)",
+                                     key="web_structured_output")
             if st.button("Generate Web Response") and question:
-                main_response, related_chunks = self.generate_response_with_related(question)
-                st.session_state[
-                    "response"] = main_response or "No response generated. Please check your question and try again."
-                st.session_state[
-                    "related_chunks"] = related_chunks or []  # Ensure related_chunks is an empty list if None
-                st.session_state["response_displayed"] = True
-                st.session_state["related_displayed"] = True
+                if structured:
+                    submit_job("web_answer_job", "test case generation", self.generate_test_cases, question,
+                               st.session_state.vector_store)
+                else:
+                    submit_job("web_answer_job", "answer", self.answer_question, question,
+                               st.session_state.vector_store)
+            poll_job("web_answer_job", self.on_answer_ready, show_output=True)
 
         # Display the generated response and related information if available
         if st.session_state.get("response_displayed"):
             st.markdown("### Generated Response:")
-            formatted_response = self.format_response(st.session_state.response)
-            st.markdown(formatted_response, unsafe_allow_html=True)
+            if st.session_state.get("test_cases"):
+                render_test_cases(st.session_state.test_cases)
+            else:
+                formatted_response = self.format_response(st.session_state.response)
+                st.markdown(formatted_response, unsafe_allow_html=True)
+            if st.session_state.get("response_cached"):
+                st.caption("Served from the response cache.")
 
             # Copy to Clipboard Button
             if st.button("Copy to Clipboard"):
@@ -71,34 +87,100 @@ class WebProcessor:
         if st.session_state.get("related_displayed") and st.session_state.related_chunks:
             self.display_related_information(st.session_state.related_chunks)
 
-        # Download options for PDF and Word document
-        col1, col2 = st.columns(2)
-        with col1:
-            pdf_data = self.generate_pdf_with_related(st.session_state.response, st.session_state.related_chunks)
-            st.download_button(
-                label="Download as PDF",
-                data=pdf_data,
-                file_name="response.pdf",
-                mime="application/pdf"
-            )
-        with col2:
-            docx_data = self.generate_word_doc_with_related(st.session_state.response, st.session_state.related_chunks)
-            st.download_button(
-                label="Download as Word Document",
-                data=docx_data,
-                file_name="response.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            )
-
-    def generate_response_with_related(self, question):
-        """Generates the main response and retrieves related information chunks with images if available."""
-        main_response = self.web_generator.generate_response(question)
-
-        # Fetch related information chunks with specified search_type
-        related_chunks = []
-        documents = st.session_state.vector_store.search(question, k=3, search_type="similarity")
+        # Download options for PDF and Word document, built only once there is a response to export
+        if st.session_state.get("response_displayed") and st.session_state.response:
+            render_downloads(st.session_state.response, st.session_state.related_chunks or [])
+
+    def prepare_web_data(self, url):
+        """Starts loading (or crawling and indexing) the pages at ``url`` in the background."""
+        urls = self.web_generator.parse_urls(url)
+        if urls:
+            submit_job("web_data_job", "web crawl", self.load_web_data, urls)
+        else:
+            st.error(LOAD_ERROR)
+
+    def refresh_web_data(self, url):
+        """Starts re-embedding whatever changed on the pages at ``url`` in the background."""
+        urls = self.web_generator.parse_urls(url)
+        if urls:
+            submit_job("web_data_job", "web refresh", self.update_web_data, urls)
+        else:
+            st.error(LOAD_ERROR)
+
+    def load_web_data(self, job, urls):
+        """Background job: returns ``(vector_store, notice)``."""
+        job.update(0.0, f"Loading {len(urls)} URL(s)...")
+        vector_store, failed_urls = self.web_generator.load_or_crawl_vector_store(urls, progress=job.update)
+        if not vector_store:
+            return None, ("error", LOAD_ERROR)
+        if failed_urls:
+            return vector_store, ("warning", f"Web data loaded, but {len(failed_urls)} page(s) could not be loaded, "
+                                             f"e.g. {failed_urls[0]}")
+        return vector_store, ("success", "Web data loaded and processed successfully!")
+
+    def update_web_data(self, job, urls):
+        """Background job: returns ``(vector_store, notice)``."""
+        job.update(0.0, f"Checking {len(urls)} URL(s) for changes...")
+        vector_store, stats = self.web_generator.refresh_vector_store(urls, progress=job.update)
+        if not vector_store:
+            return None, ("error", LOAD_ERROR)
+        return vector_store, ("success", (
+            f"Web data refreshed: {stats['pages_changed']} page(s) changed, {stats['pages_removed']} removed, "
+            f"{stats['pages_unchanged']} unchanged; {stats['chunks_added']} chunk(s) embedded, "
+            f"{stats['chunks_deleted']} deleted."
+        ))
+
+    @staticmethod
+    def on_web_data_ready(job):
+        vector_store, notice = job.result
+        st.session_state.vector_store = vector_store
+        st.session_state.web_data_loaded = vector_store is not None
+        return notice
+
+    def answer_question(self, job, question, vector_store):
+        """
+        Background job: answers ``question``, streaming the text into ``job.output`` as it arrives.
 
+        Returns:
+            dict: ``response``, ``related_chunks`` and ``cached``.
+        """
+        job.update(0.1, "Retrieving relevant passages...")
+        documents = self.web_generator.retrieve(question, vector_store)
+        related_chunks = self.build_related_chunks(documents)
+        job.update(0.3, "Generating the response...")
+        outcome = {}
+        for token in self.web_generator.stream_response(question, documents, outcome):
+            job.append_output(token)
+        return {"response": job.output, "related_chunks": related_chunks, "cached": outcome["cached"]}
+
+    def generate_test_cases(self, job, question, vector_store):
+        """Background job: like ``answer_question``, but collects structured test cases into ``job.items``."""
+        job.update(0.1, "Retrieving relevant passages...")
+        documents = self.web_generator.retrieve(question, vector_store)
+        job.update(0.3, "Generating test cases...")
+        parser = TestCaseStreamParser()
+        for test_case in self.web_generator.stream_test_cases(question, documents, parser):
+            job.append_item(test_case)
+        return {"test_cases": parser.cases, "errors": parser.errors,
+                "related_chunks": self.build_related_chunks(documents), "cached": parser.from_cache}
+
+    @staticmethod
+    def on_answer_ready(job):
+        result = job.result
+        st.session_state["related_chunks"] = result["related_chunks"] or []
+        st.session_state["response_displayed"] = True
+        st.session_state["related_displayed"] = True
+        return store_generation_result(result)
+
+    def build_related_chunks(self, documents, limit=3):
+        """Summarizes the top retrieved chunks for the related information panel."""
+        related_chunks = []
+        seen_contents = set()
         for doc in documents:
+            # Overlapping splits can surface the same passage twice
+            if doc.page_content in seen_contents:
+                continue
+            seen_contents.add(doc.page_content)
             title = doc.metadata.get("title", "Related Information")
             summary = " ".join(doc.page_content.split()[:40])  # Simple summary, taking first 40 words
             image_url = doc.metadata.get("image_url")  # Assuming metadata might contain 'image_url'
@@ -109,8 +191,10 @@ class WebProcessor:
                 "image_url": image_url  # Include image URL if available
             }
             related_chunks.append(chunk)
+            if len(related_chunks) == limit:
+                break
 
-        return main_response, related_chunks
+        return related_chunks
 
     def display_related_information(self, related_chunks):
         """Displays related information with optional images."""
@@ -122,66 +206,4 @@ class WebProcessor:
                 st.image(chunk["image_url"], use_column_width=True)
 
     def format_response(self, text):
-        formatted_text = ""
-        lines = text.splitlines()
-        for line in lines:
-            if line.startswith("1. ") or line.startswith("2. "):
-                formatted_text += f"<li>{line[3:]}</li>"
-            elif "**" in line:
-                formatted_text += f"<p><b>{line}</b></p>"
-            else:
-                formatted_text += f"<p>{line}</p>"
-
-        return f"""
-            <div style="background-color: #f0f4f8; padding: 20px; border-radius: 8px; border: 1px solid #ddd;
-                        font-family: Arial, sans-serif; color: #333; max-height: 300px; overflow-y: scroll;">
-                {formatted_text}
-            </div>
-        """
-
-    def generate_pdf_with_related(self, text, related_chunks):
-        """Generates a PDF with the main response and related information."""
-        pdf_buffer = BytesIO()
-        pdf = canvas.Canvas(pdf_buffer, pagesize=letter)
-        pdf.setFont("Helvetica", 12)
-
-        width, height = letter
-        y_position = height - 40
-
-        # Write main response
-        for line in text.splitlines():
-            if y_position <= 40:
-                pdf.showPage()
-                y_position = height - 40
-            pdf.drawString(40, y_position, line)
-            y_position -= 14
-
-        # Write related chunks
-        for chunk in related_chunks or []:  # Handle potential None by defaulting to an empty list
-            pdf.drawString(40, y_position, f"Title: {chunk['title']}")
-            y_position -= 14
-            pdf.drawString(40, y_position, f"Summary: {chunk['summary']}")
-            y_position -= 14
-            if y_position <= 40:
-                pdf.showPage()
-                y_position = height - 40
-
-        pdf.save()
-        pdf_buffer.seek(0)
-        return pdf_buffer
-
-    def generate_word_doc_with_related(self, text, related_chunks):
-        """Generates a Word document with the main response and related information."""
-        doc_buffer = BytesIO()
-        doc = Document()
-        doc.add_paragraph("Generated Response:")
-        doc.add_paragraph(text)
-
-        doc.add_paragraph("Related Information:")
-        for chunk in related_chunks or []:  # Handle potential None by defaulting to an empty list
-            doc.add_paragraph(f"Title: {chunk['title']}")
-            doc.add_paragraph(f"Summary: {chunk['summary']}")
-
-        doc.save(doc_buffer)
-        doc_buffer.seek(0)
-        return doc_buffer
+        return format_response_html(text)
@@ -1,19 +1,70 @@
-from langchain.chains import RetrievalQA
 from langchain.chat_models import ChatOpenAI
-from langchain.document_loaders import WebBaseLoader
 from langchain_community.embeddings import OpenAIEmbeddings
 from langchain.prompts import PromptTemplate
+from langchain.schema.output_parser import StrOutputParser
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-import streamlit as st
+from context_assembler import ContextAssembler, count_tokens
+from hybrid_retriever import HybridRetriever, create_reranker
+from index_store import documents_hash, get_index_store, manifest_hash
+from metrics import get_metrics
+from response_cache import get_response_cache, make_cache_key, text_hash
+from structured_output import STRUCTURED_OUTPUT_INSTRUCTIONS, TestCaseStreamParser
+from web_fetcher import WebFetcher, is_sitemap_url, parse_page, parse_pages
+from concurrent.futures import FIRST_COMPLETED, wait
+import hashlib
+import logging
+import re
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
 
 class WebTestCaseGenerator:
-    def __init__(self, api_key=None, model_name="gpt-4o-mini", temperature=0.5):
-        self.api_key = api_key or st.session_state.get("api_key")
-        if not self.api_key:
-            st.error("API key is required for generating responses.")
-            return
-        self.model = ChatOpenAI(api_key=self.api_key, model_name=model_name, temperature=temperature)
+    def __init__(self, api_key=None, model_name="gpt-4o-mini", temperature=0.5, chunk_size=1000, chunk_overlap=150,
+                 embedding_batch_size=64, retrieval_k=4, index_store=None, fetcher=None, max_pages=500,
+                 response_cache=None, base_url=None, http_client=None, hybrid_retrieval=True, fetch_k=20,
+                 reranker="overlap", context_token_budget=3000, remove_boilerplate=True, metrics=None,
+                 chat_model=None, embeddings=None, cpu_pool=None, pages_per_task=4, max_pending_parses=16):
+        if not api_key:
+            raise ValueError("API key is required for generating responses.")
+        self.api_key = api_key
+        self.metrics = metrics or get_metrics()
+        # base_url points the client at any OpenAI-compatible endpoint (e.g. a local fake for CI)
+        self.base_url = base_url
+        self.http_client = http_client
+        # chat_model / embeddings substitute compatible local models (e.g. the offline fakes in benchmark.py)
+        self.model = chat_model or ChatOpenAI(api_key=self.api_key, model_name=model_name, temperature=temperature,
+                                              openai_api_base=base_url, http_client=http_client)
+        self.embeddings = embeddings
         self.prompt = self.create_prompt()
+        # Built once; only the retrieved context changes between questions
+        self.answer_chain = self.prompt | self.model | StrOutputParser()
+        self.structured_prompt = self.create_structured_prompt()
+        self.structured_chain = self.structured_prompt | self.model | StrOutputParser()
+        self._retrievers = weakref.WeakKeyDictionary()
+        self._retrievers_lock = threading.Lock()
+        self.response_cache = response_cache or get_response_cache()
+        self.retrieval_k = retrieval_k
+        # Keyword search catches exact identifiers (button labels, error codes) that embeddings miss
+        self.hybrid_retrieval = hybrid_retrieval
+        self.fetch_k = fetch_k
+        self.reranker = create_reranker(reranker)
+        self.context_assembler = ContextAssembler(max_tokens=context_token_budget, model_name=model_name)
+        self.remove_boilerplate = remove_boilerplate
+        self.embedding_batch_size = embedding_batch_size
+        self.index_store = index_store or get_index_store()
+        self.fetcher = fetcher or WebFetcher(metrics=self.metrics)
+        self.max_pages = max_pages
+        # Optional process pool (see cpu_pool) that parses crawled pages off the main interpreter
+        self.cpu_pool = cpu_pool
+        self.pages_per_task = pages_per_task
+        self.max_pending_parses = max_pending_parses
+        # Chunks inherit the page's metadata (title, source) and record their offset in it
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+        )
 
     def create_prompt(self):
         template = (
@@ -21,48 +72,399 @@ class WebTestCaseGenerator:
         )
         return PromptTemplate(template=template, input_variables=["question", "context"])
 
-    def load_web_documents(self, url):
+    def create_structured_prompt(self):
+        # The schema's braces must not be read as template variables
+        instructions = STRUCTURED_OUTPUT_INSTRUCTIONS.replace("{", "{{").replace("}", "}}")
+        return PromptTemplate(template=f"{self.create_prompt().template} {instructions}",
+                              input_variables=["question", "context"])
+
+    def split_documents(self, documents):
+        return self.text_splitter.split_documents(documents)
+
+    def create_embeddings(self):
+        if self.embeddings is not None:
+            return self.embeddings
+        return OpenAIEmbeddings(api_key=self.api_key, chunk_size=self.embedding_batch_size,
+                                openai_api_base=self.base_url, http_client=self.http_client)
+
+    @staticmethod
+    def chunk_ids(chunks):
+        """Stable per-chunk ids derived from the page URL and chunk text."""
+        ids = []
+        occurrences = {}
+        for chunk in chunks:
+            key = f"{chunk.metadata.get('source', '')}\0{chunk.page_content}"
+            chunk_id = hashlib.sha256(key.encode("utf-8")).hexdigest()
+            count = occurrences.get(chunk_id, 0)
+            occurrences[chunk_id] = count + 1
+            ids.append(chunk_id if count == 0 else f"{chunk_id}-{count}")
+        return ids
+
+    def add_chunks(self, vector_store, chunks, ids, embeddings):
+        """Embeds ``chunks`` into ``vector_store`` in batches, creating the store on the first batch."""
+        # Embed in batches so large sites never send one oversized request
+        for start in range(0, len(chunks), self.embedding_batch_size):
+            batch = chunks[start:start + self.embedding_batch_size]
+            batch_ids = ids[start:start + self.embedding_batch_size]
+            with self.metrics.timer("embedding", bytes=sum(len(chunk.page_content) for chunk in batch)):
+                if vector_store is None:
+                    vector_store = FAISS.from_documents(batch, embeddings, ids=batch_ids)
+                else:
+                    vector_store.add_documents(batch, ids=batch_ids)
+        return vector_store
+
+    def build_index(self, documents, validators=None):
+        """
+        Splits and embeds pages into a new index, consuming ``documents`` lazily.
+
+        Args:
+            documents (iterable): Page documents, e.g. a generator fed by the fetcher.
+            validators (dict): Optional ``url -> (etag, last_modified)`` recorded in the manifest.
+
+        Returns:
+            tuple: ``(vector_store, manifest)``, where the manifest maps each page URL to its
+            content hash and chunk ids.
+        """
+        # Unchanged chunks are served from the shared on-disk embedding cache
+        embeddings = self.index_store.cached_embeddings(self.create_embeddings())
+        validators = validators if validators is not None else {}
+        vector_store = None
+        manifest = {}
+        pending_chunks = []
+        pending_ids = []
+        for document in documents:
+            source = document.metadata.get("source", "")
+            chunks = self.split_documents([document])
+            ids = self.chunk_ids(chunks)
+            etag, last_modified = validators.get(source, (None, None))
+            manifest[source] = {"page_hash": documents_hash([document]), "chunk_ids": ids,
+                                "etag": etag, "last_modified": last_modified}
+            pending_chunks.extend(chunks)
+            pending_ids.extend(ids)
+            if len(pending_chunks) >= self.embedding_batch_size:
+                vector_store = self.add_chunks(vector_store, pending_chunks, pending_ids, embeddings)
+                pending_chunks, pending_ids = [], []
+        vector_store = self.add_chunks(vector_store, pending_chunks, pending_ids, embeddings)
+        return vector_store, manifest
+
+    @staticmethod
+    def parse_urls(text):
+        """Splits user input into URLs (one per line, or separated by whitespace/commas)."""
+        return list(dict.fromkeys(url for url in re.split(r"[\s,]+", text or "") if url))
+
+    def expand_urls(self, urls):
+        """Replaces sitemap URLs with the pages they list, capped at ``max_pages``."""
+        page_urls = []
+        for url in urls:
+            page_urls.extend(self.fetcher.expand_sitemap(url, self.max_pages) if is_sitemap_url(url) else [url])
+        return list(dict.fromkeys(page_urls))[:self.max_pages]
+
+    def result_to_document(self, result):
+        with self.metrics.timer("html_parse", bytes=len(result.content)):
+            return parse_page(result.url, result.content, self.remove_boilerplate)
+
+    def iter_documents(self, page_urls, failed_urls, validators, progress=None):
+        """Yields parsed pages as concurrent fetches complete, recording failures and validators."""
+        if self.cpu_pool is not None:
+            yield from self.iter_documents_parallel(page_urls, failed_urls, validators, progress)
+            return
+        for done, result in enumerate(self.fetcher.fetch_all(page_urls, conditional=False), start=1):
+            if progress is not None:
+                progress(done / len(page_urls), f"Fetched and indexed {done} of {len(page_urls)} page(s)")
+            if not result.ok:
+                failed_urls.append(result.url)
+                continue
+            document = self.result_to_document(result)
+            if document is not None:
+                validators[result.url] = (result.etag, result.last_modified)
+                yield document
+
+    def iter_documents_parallel(self, page_urls, failed_urls, validators, progress=None):
+        """
+        Like ``iter_documents``, but parses batches of fetched pages on ``cpu_pool`` workers.
+
+        Fetching, parsing and the caller's embedding overlap; at most ``max_pending_parses``
+        batches are in flight, so a fast crawl cannot queue unbounded HTML in memory.
+        """
+        pending = {}  # future -> fetch results of its batch
+        batch = []
         try:
-            loader = WebBaseLoader(url)
-            documents = loader.load()
-            if not documents:
-                st.error("No documents found from the URL. Please try a different URL.")
-            else:
-                for doc in documents:
-                    doc.page_content = ' '.join(doc.page_content.split())
-            return documents
-        except Exception as e:
-            st.error(f"Failed to load documents from URL: {e}")
-            return None
-
-    def create_vector_store(self, documents):
-        if not documents:
-            return None
-        embeddings = OpenAIEmbeddings(api_key=self.api_key)
-        return FAISS.from_documents(documents, embeddings)
-
-    def prepare_web_data(self, url):
-        documents = self.load_web_documents(url)
-        if documents:
-            st.session_state.vector_store = self.create_vector_store(documents)
-            if st.session_state.vector_store:
-                st.session_state.web_data_loaded = True
-                return "Web data loaded and processed successfully!"
-            else:
-                return "Error: Failed to create vector store from web data."
-        else:
-            return "Error: Failed to load documents from the specified URL."
-
-    def generate_response(self, query):
-        if "vector_store" not in st.session_state or st.session_state.vector_store is None:
-            return "Error: Vector store is not initialized. Please load web data first."
-
-        chain_type_kwargs = {"prompt": self.prompt}
-        chain = RetrievalQA.from_chain_type(
-            llm=self.model,
-            chain_type="stuff",
-            retriever=st.session_state.vector_store.as_retriever(search_kwargs={"k": 1}),
-            chain_type_kwargs=chain_type_kwargs
+            for done, result in enumerate(self.fetcher.fetch_all(page_urls, conditional=False), start=1):
+                if progress is not None:
+                    progress(done / len(page_urls), f"Fetched and indexed {done} of {len(page_urls)} page(s)")
+                if not result.ok:
+                    failed_urls.append(result.url)
+                    continue
+                batch.append(result)
+                if len(batch) < self.pages_per_task:
+                    continue
+                pending[self.submit_parse(batch)] = batch
+                batch = []
+                while len(pending) > self.max_pending_parses:
+                    yield from self.collect_parsed(pending, validators)
+            if batch:
+                pending[self.submit_parse(batch)] = batch
+            while pending:
+                yield from self.collect_parsed(pending, validators)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def submit_parse(self, batch):
+        pages = [(result.url, result.content) for result in batch]
+        return self.cpu_pool.submit(parse_pages, pages, self.remove_boilerplate)
+
+    def collect_parsed(self, pending, validators):
+        """Waits for at least one parse batch, removes it from ``pending`` and yields its documents."""
+        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in finished:
+            batch = pending.pop(future)
+            for result, (document, seconds) in zip(batch, future.result()):
+                self.metrics.observe("html_parse", seconds, bytes=len(result.content))
+                if document is not None:
+                    validators[result.url] = (result.etag, result.last_modified)
+                    yield document
+
+    def crawl_site(self, urls, progress=None):
+        """
+        Fetches pages concurrently and embeds them into one index as they arrive.
+
+        Args:
+            urls (list): Page URLs and/or sitemap.xml URLs.
+            progress (callable): Optional ``progress(fraction, message)`` callback, called per page;
+                an exception it raises (e.g. a cancelled job) aborts the crawl.
+
+        Returns:
+            tuple: ``(vector_store, manifest, failed_urls)``; the store is None if no page loaded.
+        """
+        failed_urls = []
+        validators = {}
+        vector_store, manifest = self.build_index(
+            self.iter_documents(self.expand_urls(urls), failed_urls, validators, progress), validators
         )
-        response = chain.run(query)
-        return response
+        return vector_store, manifest, failed_urls
+
+    @staticmethod
+    def site_key(urls):
+        return "\n".join(sorted(urls))
+
+    def load_or_crawl_vector_store(self, urls, progress=None):
+        """
+        Reuses a fresh saved index for this set of URLs, otherwise crawls and saves a new one.
+
+        ``progress`` is passed to ``crawl_site``.
+
+        Returns:
+            tuple: ``(vector_store, failed_urls)``; the store is None if no page could be loaded.
+        """
+        site_key = self.site_key(urls)
+        with self.metrics.timer("index_load"):
+            vector_store = self.index_store.load_fresh(site_key, self.create_embeddings())
+        self.metrics.cache_lookup("saved_index", vector_store is not None)
+        if vector_store is not None:
+            return vector_store, []
+
+        with self.metrics.timer("crawl"):
+            vector_store, manifest, failed_urls = self.crawl_site(urls, progress)
+        if failed_urls:
+            logger.warning("Could not load %d page(s), e.g. %s", len(failed_urls), failed_urls[0])
+        if vector_store is not None:
+            self.index_store.save(site_key, manifest_hash(manifest), vector_store, manifest)
+        return vector_store, failed_urls
+
+    def refresh_vector_store(self, urls, progress=None):
+        """
+        Brings the saved index for ``urls`` up to date, embedding only new or changed chunks.
+
+        Pages are refetched with conditional GETs; unchanged pages are skipped, changed pages
+        have their stale chunk vectors deleted and new ones added, and pages that disappeared
+        (removed from the sitemap or returning 404/410) are dropped from the index. ``progress``
+        is called per page, as in ``crawl_site``.
+
+        Returns:
+            tuple: ``(vector_store, stats)`` where stats counts pages and chunks touched.
+        """
+        site_key = self.site_key(urls)
+        embeddings = self.index_store.cached_embeddings(self.create_embeddings())
+        content_hash = self.index_store.latest_content_hash(site_key)
+        manifest = self.index_store.load_manifest(site_key, content_hash) if content_hash else None
+        vector_store = self.index_store.load(site_key, content_hash, embeddings, writable=True) if manifest else None
+        if vector_store is None:
+            # Nothing (or an index without a manifest) to diff against
+            vector_store, manifest, _ = self.crawl_site(urls, progress)
+            if vector_store is not None:
+                self.index_store.save(site_key, manifest_hash(manifest), vector_store, manifest)
+            return vector_store, {"pages_unchanged": 0, "pages_changed": len(manifest), "pages_removed": 0,
+                                  "chunks_added": sum(len(entry["chunk_ids"]) for entry in manifest.values()),
+                                  "chunks_deleted": 0}
+
+        for source, entry in manifest.items():
+            self.fetcher.remember(source, entry.get("etag"), entry.get("last_modified"))
+
+        stats = {"pages_unchanged": 0, "pages_changed": 0, "pages_removed": 0, "chunks_added": 0, "chunks_deleted": 0}
+        new_manifest = {}
+        add_chunks, add_ids, delete_ids = [], [], []
+        page_urls = self.expand_urls(urls)
+        for done, result in enumerate(self.fetcher.fetch_all(page_urls, conditional=True), start=1):
+            if progress is not None:
+                progress(done / len(page_urls), f"Checked {done} of {len(page_urls)} page(s) for changes")
+            old_entry = manifest.get(result.url)
+            if result.not_modified and old_entry is None:
+                result = self.fetcher.fetch(result.url, conditional=False)
+            if result.not_modified:
+                new_manifest[result.url] = old_entry
+                stats["pages_unchanged"] += 1
+                continue
+            if not result.ok:
+                # Keep the old vectors on transient failures; drop them when the page is gone
+                if old_entry is not None and result.status not in (404, 410):
+                    new_manifest[result.url] = old_entry
+                continue
+
+            document = self.result_to_document(result)
+            if document is None:
+                continue
+            page_hash = documents_hash([document])
+            if old_entry is not None and old_entry["page_hash"] == page_hash:
+                new_manifest[result.url] = dict(old_entry, etag=result.etag, last_modified=result.last_modified)
+                stats["pages_unchanged"] += 1
+                continue
+
+            chunks = self.split_documents([document])
+            ids = self.chunk_ids(chunks)
+            old_ids = set(old_entry["chunk_ids"]) if old_entry else set()
+            for chunk, chunk_id in zip(chunks, ids):
+                if chunk_id not in old_ids:
+                    add_chunks.append(chunk)
+                    add_ids.append(chunk_id)
+            delete_ids.extend(old_ids.difference(ids))
+            new_manifest[result.url] = {"page_hash": page_hash, "chunk_ids": ids,
+                                        "etag": result.etag, "last_modified": result.last_modified}
+            stats["pages_changed"] += 1
+
+        for source, entry in manifest.items():
+            if source not in new_manifest:
+                delete_ids.extend(entry["chunk_ids"])
+                stats["pages_removed"] += 1
+
+        if delete_ids:
+            vector_store.delete(delete_ids)
+        vector_store = self.add_chunks(vector_store, add_chunks, add_ids, embeddings)
+        stats["chunks_added"] = len(add_ids)
+        stats["chunks_deleted"] = len(delete_ids)
+
+        new_hash = manifest_hash(new_manifest)
+        if new_hash != content_hash:
+            self.index_store.save(site_key, new_hash, vector_store, new_manifest)
+        else:
+            # Every page was checked and nothing changed, so the saved index is fresh again
+            self.index_store.mark_verified(site_key, content_hash)
+        return vector_store, stats
+
+    def get_retriever(self, vector_store):
+        """Returns the retriever for ``vector_store``, creating it on first use."""
+        with self._retrievers_lock:
+            retriever = self._retrievers.get(vector_store)
+            if retriever is None:
+                if self.hybrid_retrieval:
+                    retriever = HybridRetriever(vector_store, k=self.retrieval_k, fetch_k=self.fetch_k,
+                                                reranker=self.reranker)
+                else:
+                    retriever = vector_store.as_retriever(search_kwargs={"k": self.retrieval_k})
+                self._retrievers[vector_store] = retriever
+            return retriever
+
+    def retrieve(self, query, vector_store):
+        """Retrieves the chunks for ``query`` once, so the answer and related panel share them."""
+        with self.metrics.timer("retrieval"):
+            return self.get_retriever(vector_store).invoke(query)
+
+    def format_context(self, documents):
+        # Same layout as the "stuff" chain (passages separated by blank lines), capped at the token budget
+        with self.metrics.timer("context_assembly") as stage:
+            context = self.context_assembler.assemble(documents)
+            stage["bytes"] = len(context)
+        return context
+
+    def count_answer_tokens(self, query, context, response, prompt=None):
+        """Local estimate of the prompt and completion tokens of one answer (streaming reports no usage)."""
+        prompt = (prompt or self.prompt).format(question=query, context=context)
+        return count_tokens(prompt, self.model.model_name) + count_tokens(response, self.model.model_name)
+
+    def response_cache_key(self, query, context, prompt=None):
+        return make_cache_key(self.model.model_name, self.model.temperature, (prompt or self.prompt).template, query,
+                              context_hash=text_hash(context))
+
+    def stream_response(self, query, documents, outcome=None):
+        """
+        Yields the answer token by token as the model produces it (or at once from the cache).
+
+        Args:
+            outcome (dict): Receives ``cached`` (bool) before the first token; pass one in to
+                tell a cache hit from a fresh answer.
+        """
+        context = self.format_context(documents)
+        cache_key = self.response_cache_key(query, context)
+        cached = self.response_cache.get(cache_key)
+        self.metrics.cache_lookup("web_response", cached is not None)
+        if outcome is not None:
+            outcome["cached"] = cached is not None
+        if cached is not None:
+            yield cached
+            return
+
+        tokens = []
+        started = time.perf_counter()
+        for token in self.answer_chain.stream({"question": query, "context": context}):
+            tokens.append(token)
+            yield token
+        # Only reached when the stream was consumed to the end
+        response = "".join(tokens)
+        self.metrics.observe("llm_answer", time.perf_counter() - started,
+                             tokens=self.count_answer_tokens(query, context, response))
+        self.response_cache.set(cache_key, response)
+
+    def stream_test_cases(self, query, documents, parser=None):
+        """
+        Yields validated test cases for ``query`` as soon as each one is complete in the model's output.
+
+        Args:
+            parser (TestCaseStreamParser): Collects the cases and any validation errors; pass one
+                in to inspect them afterwards.
+        """
+        parser = parser or TestCaseStreamParser()
+        context = self.format_context(documents)
+        cache_key = self.response_cache_key(query, context, self.structured_prompt)
+        cached = self.response_cache.get(cache_key)
+        self.metrics.cache_lookup("web_test_cases", cached is not None)
+        if cached is not None:
+            parser.from_cache = True
+            yield from parser.feed(cached)
+            return
+
+        tokens = []
+        started = time.perf_counter()
+        for token in self.structured_chain.stream({"question": query, "context": context}):
+            tokens.append(token)
+            yield from parser.feed(token)
+        response = "".join(tokens)
+        self.metrics.observe("llm_test_cases", time.perf_counter() - started,
+                             tokens=self.count_answer_tokens(query, context, response, self.structured_prompt))
+        # Output without a single valid case is not worth serving again
+        if parser.cases:
+            self.response_cache.set(cache_key, response)
+
+    def answer(self, query, documents):
+        """Returns ``(response, cache_hit)`` for ``query`` answered from ``documents``."""
+        context = self.format_context(documents)
+        cache_key = self.response_cache_key(query, context)
+        cached = self.response_cache.get(cache_key)
+        self.metrics.cache_lookup("web_response", cached is not None)
+        if cached is not None:
+            return cached, True
+
+        with self.metrics.timer("llm_answer") as stage:
+            response = self.answer_chain.invoke({"question": query, "context": context})
+            stage["tokens"] = self.count_answer_tokens(query, context, response)
+        self.response_cache.set(cache_key, response)
+        return response, False
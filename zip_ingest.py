@@ -0,0 +1,159 @@
+# zip_ingest.py
+import os
+import shutil
+import threading
+from zipfile import ZipFile
+from PIL import Image
+from cpu_pool import chunked, map_chunks
+from image_dedup import DEFAULT_THRESHOLD, HASH_SIZE, cluster_hashes, hash_pixels
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+THUMBNAIL_SIZE = (320, 320)
+
+
+def is_image_member(info):
+    """True for regular ZIP entries with an image extension (skips folders and macOS metadata)."""
+    name = info.filename
+    if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("._"):
+        return False
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def make_thumbnail(stream, thumbnail_path, size=THUMBNAIL_SIZE):
+    """Decodes an image stream at reduced resolution, writes a small JPEG thumbnail and returns it."""
+    with Image.open(stream) as image:
+        # JPEG draft mode lets the decoder scale by 1/2..1/8 in the DCT domain
+        image.draft("RGB", size)
+        image.thumbnail(size, reducing_gap=2.0)
+        thumbnail = image.convert("RGB")
+    thumbnail.save(thumbnail_path, format="JPEG", quality=85)
+    return thumbnail
+
+
+class Gallery:
+    """Thumbnails of the images in a spooled ZIP archive; full images are decoded on demand."""
+
+    def __init__(self, archive_path, members, thumbnails, hashes):
+        self.archive_path = archive_path
+        self.members = members
+        self.thumbnails = thumbnails
+        self.hashes = hashes  # Perceptual hash per image, for near-duplicate clustering
+        self._clusters = {}
+        self._selected = (None, None)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.members)
+
+    def caption(self, index):
+        return os.path.basename(self.members[index])
+
+    def clusters(self, threshold=DEFAULT_THRESHOLD):
+        """Near-duplicate clusters (lists of indices, representative first), computed once per threshold."""
+        with self._lock:
+            if threshold not in self._clusters:
+                self._clusters[threshold] = cluster_hashes(self.hashes, threshold)
+            return self._clusters[threshold]
+
+    def decode_image(self, index):
+        """Decodes the full-resolution RGB image for ``index`` straight from the archive."""
+        with ZipFile(self.archive_path, 'r') as zip_ref, zip_ref.open(self.members[index]) as stream:
+            with Image.open(stream) as image:
+                return image.convert("RGB")
+
+    def load_image(self, index):
+        """Like ``decode_image``, but keeps the most recently selected image decoded across reruns."""
+        with self._lock:
+            cached_index, cached_image = self._selected
+            if cached_index == index:
+                return cached_image
+
+        rgb_image = self.decode_image(index)
+        with self._lock:
+            self._selected = (index, rgb_image)
+        return rgb_image
+
+
+def thumbnail_members(tasks, archive_path, thumbnail_size=THUMBNAIL_SIZE):
+    """
+    Writes thumbnails for ``(zip_info, thumbnail_path)`` tasks of one archive.
+
+    Runs inline or in a worker process: workers open the spooled archive themselves, so only
+    member names go in and only tiny hash grids come back, never image data.
+
+    Returns:
+        list: Per task, the grayscale hash grid as bytes, or None for unreadable images.
+    """
+    grids = []
+    with ZipFile(archive_path, 'r') as zip_ref:
+        for info, thumbnail_path in tasks:
+            try:
+                with zip_ref.open(info) as stream:
+                    thumbnail = make_thumbnail(stream, thumbnail_path, thumbnail_size)
+            except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+                # Corrupt or unsupported image data; leave it out of the gallery
+                grids.append(None)
+                continue
+            # Keep only the tiny grayscale grid needed for the perceptual hash
+            grids.append(thumbnail.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).tobytes())
+    return grids
+
+
+def build_gallery(zip_file, gallery_dir, thumbnail_size=THUMBNAIL_SIZE, chunk_size=1024 * 1024, progress=None,
+                  executor=None, members_per_task=8):
+    """
+    Moves or spools an uploaded ZIP into ``gallery_dir`` and generates thumbnails member by member.
+
+    Only image entries are read, one at a time per worker, so peak memory is bounded by the
+    largest single image (times the number of workers) rather than by the size of the archive.
+
+    Args:
+        zip_file: Path of an already spooled archive (moved into ``gallery_dir``), or a file-like
+            object holding the uploaded archive (copied).
+        gallery_dir (str): Directory that receives the spooled archive and thumbnails.
+        thumbnail_size (tuple): Maximum thumbnail width and height.
+        chunk_size (int): Copy buffer size used when spooling the upload.
+        progress (callable): Optional ``progress(fraction, message)`` callback, called per batch of
+            images; an exception it raises (e.g. a cancelled job) aborts the build.
+        executor: Optional process pool (see ``cpu_pool``) that decodes batches of images in parallel.
+        members_per_task (int): Images per unit of work handed to the pool.
+
+    Returns:
+        Gallery: The prepared gallery (possibly empty).
+    """
+    archive_path = os.path.join(gallery_dir, "archive.zip")
+    if isinstance(zip_file, str):
+        shutil.move(zip_file, archive_path)
+    else:
+        zip_file.seek(0)
+        with open(archive_path, "wb") as archive:
+            shutil.copyfileobj(zip_file, archive, chunk_size)
+        zip_file.seek(0)
+
+    with ZipFile(archive_path, 'r') as zip_ref:
+        image_infos = [info for info in zip_ref.infolist() if is_image_member(info)]
+    # Thumbnails are named by position so same-named files in different folders never collide
+    tasks = [(info, os.path.join(gallery_dir, f"thumb_{position:05d}.jpg"))
+             for position, info in enumerate(image_infos)]
+    chunks = chunked(tasks, members_per_task)
+
+    grids = [None] * len(tasks)
+    done = 0
+    for index, chunk_grids in map_chunks(thumbnail_members, chunks, archive_path, thumbnail_size, executor=executor):
+        start = index * members_per_task
+        grids[start:start + len(chunk_grids)] = chunk_grids
+        done += len(chunk_grids)
+        if progress is not None:
+            progress(done / len(tasks), f"Prepared {done} of {len(tasks)} thumbnails...")
+
+    members = []
+    thumbnails = []
+    hash_inputs = []
+    for (info, thumbnail_path), grid in zip(tasks, grids):
+        if grid is None:
+            continue
+        members.append(info.filename)
+        thumbnails.append(thumbnail_path)
+        hash_inputs.append(Image.frombytes("L", (HASH_SIZE + 1, HASH_SIZE), grid))
+
+    return Gallery(archive_path, members, thumbnails, hash_pixels(hash_inputs))